@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+Shared planning and execution engine for the OT-2 crystallization protocols.
+"""
+
+from .vials import vialPipetteOffsets, VIAL_MODELS, LiquidHeightModel, vial_depth, vial_depths, getTopOffset
+from .delays import ADAPTIVE_DELAYS, DelayPolicy
+from .liquids import LIQUIDS, LiquidClass
+from .labware import LabwareError, PLATE_SETTINGS, plate_settings
+from .engine import (Target, Step, DEFAULT_SETTINGS, DEFAULT_DECK, DECK_96, PipetteError,
+                     plan_plate, execute)
+from .ledger import SourceVolumeError, ledger, check_volumes, ledger_report
+from .runner import run_plate
+from .checkpoint import Checkpoint, checkpoints, resume_plan
+from .telemetry import Telemetry, read_events, telemetry_report
+from .scheduler import schedule, schedule_plates, travel_report, travel_mm
+from .layout import optimize_layout, layout_report
+from .batch import batch_spec
+from .graph import Task, TaskGraph, task_graph
+from .screens import build_plate, grid_wells, Gradient, Rows, Columns, Fill
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Offline tools for the protocol scripts:
+
+    python -m crystal_engine estimate [script.py ...]   # run time per BLOCK and reagent
+    python -m crystal_engine ledger   [script.py ...]   # source volumes and recommended fills
+    python -m crystal_engine travel   [script.py ...]   # gantry travel before/after scheduling
+    python -m crystal_engine tips     [script.py ...]   # tips per pipette and BLOCK, racks needed
+    python -m crystal_engine graph    [script.py ...]   # the task graph as JSON
+    python -m crystal_engine layout   [script.py ...]   # the deck slots with the least travel
+    python -m crystal_engine run      [script.py ...]   # the script's own run() on the fake context
+    python -m crystal_engine bench    [--update]        # compare against the stored baseline
+    python -m crystal_engine telemetry [log.jsonl ...]  # where a logged run spent its time
+
+With no scripts given, every protocol in the repo is used (telemetry reads
+the default log, see crystal_engine.telemetry).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from .bench import bench
+from .engine import DEFAULT_DECK, plan_plate
+from .estimate import _minutes, load_protocol, report, run_protocol
+from .graph import task_graph
+from .layout import layout_report
+from .ledger import ledger_report
+from .scheduler import travel_report
+from .telemetry import log_path, read_events, runs, telemetry_report
+from .tips import tip_report
+
+
+PROTOCOLS = ['OT2_HEWL_PC.py', 'CJ_single_tip_V5.py', 'mock_crystal_testAll_V5.py']
+
+
+def _travel(spec, name):
+    print(f'== {name} ==')
+    travel_report(spec)
+    print()
+
+
+def _run(path):
+    start    = time.perf_counter()
+    protocol = run_protocol(path)
+    took     = (time.perf_counter() - start) * 1000
+    counts   = ', '.join(f'{n} {kind}' for kind, n in sorted(protocol.commands.counts().items()))
+
+    print(f'== {os.path.basename(path)}: {len(protocol.commands)} commands, '
+          f'{_minutes(protocol.elapsed).strip()} on the robot, simulated in {took:.0f} ms ==')
+    print(counts)
+    print()
+
+
+def _graph(spec, name):
+    print(task_graph(spec).to_json(indent=1))
+
+
+def _tips(spec, name):
+    tip_report(spec.get('deck') or DEFAULT_DECK, plan_plate(spec), name)
+
+
+COMMANDS = {
+    'estimate': report,
+    'graph':    _graph,
+    'layout':   layout_report,
+    'ledger':   ledger_report,
+    'tips':     _tips,
+    'travel':   _travel,
+}
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m crystal_engine')
+    parser.add_argument('command', choices=sorted(COMMANDS) + ['bench', 'run', 'telemetry'])
+    parser.add_argument('scripts', nargs='*')
+    parser.add_argument('--update', action='store_true', help='bench: store the numbers as the baseline')
+    args   = parser.parse_args(argv)
+
+    root    = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    scripts = args.scripts or [os.path.join(root, name) for name in PROTOCOLS]
+
+    if args.command == 'bench':
+        sys.exit(1 if bench(scripts, args.update) else 0)
+
+    if args.command == 'telemetry':
+        for path in args.scripts or [log_path()]:
+            for run, events in runs(read_events(path)).items():
+                telemetry_report(events, ' '.join(filter(None, [os.path.basename(path), run])))
+        return
+
+    for path in scripts:
+        if args.command == 'run':
+            _run(path)
+            continue
+        COMMANDS[args.command](load_protocol(path).plate_spec(), os.path.basename(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Batch mode: several crystallization plates in one run.
+
+batch_spec() takes a script's single plate spec and one screen per plate,
+loads the extra plates into free deck slots and builds each plate's
+well_information with the script's make_plate(wells, screen), so every plate
+can carry its own gradient. The engine fills each reagent across all the
+plates before it opens the next source and then sets the drops plate by
+plate; tip pickups and source trips are shared by the whole batch.
+"""
+
+from .deck import fits
+from .engine import DEFAULT_DECK, PLATE
+
+
+
+# crystal_plate, crystal_plate_2, crystal_plate_3, ...
+
+def plate_names(n):
+    return [PLATE] + [f'{PLATE}_{i}' for i in range(2, n + 1)]
+
+
+
+# a copy of deck with n plates of the same type as its crystal_plate, the
+# extra ones in the first free slots they fit in
+
+def batch_deck(deck, n):
+    load_name = deck['labware'][PLATE][0]
+    labware   = dict(deck['labware'])
+
+    for name in plate_names(n)[1:]:
+        slots = fits(dict(deck, labware=labware), load_name)
+        if not slots:
+            raise ValueError(f'no room on the deck for {name}; {n} plates do not fit')
+        labware[name] = (load_name, slots[0])
+
+    return dict(deck, labware=labware)
+
+
+
+# screens is one dict per plate, handed to make_plate as is. A screen may
+# also carry its own 'wells'; the rest of spec is shared by every plate
+
+def batch_spec(spec, screens, make_plate):
+    deck   = batch_deck(spec.get('deck') or DEFAULT_DECK, len(screens))
+    plates = {}
+
+    for name, screen in zip(plate_names(len(screens)), screens):
+        wells        = screen.get('wells', spec['wells'])
+        plates[name] = {'wells': wells, 'well_information': make_plate(wells, screen)}
+
+    return dict(spec, plates=plates, deck=deck)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks: every protocol's run() on the FakeProtocolContext, measured and
+compared with a stored baseline.
+
+    python -m crystal_engine bench             # compare, exit 1 on a regression
+    python -m crystal_engine bench --update    # accept the current numbers
+
+Every metric is lower-is-better. Times and travel may drift by TOLERANCE
+before they count as a regression; command and tip counts may not grow at
+all. The baseline lives in crystal_engine/bench_baseline.json and should be
+committed together with the change that moved it.
+"""
+
+import json
+import os
+
+from .deck import leg_mm
+from .estimate import run_protocol
+
+
+BASELINE  = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+TOLERANCE = 0.01   # 1% on seconds and mm
+
+# metric: (label, compared with tolerance)
+METRICS = {
+    'seconds':   ('run time (s)',     True),
+    'travel_mm': ('travel (mm)',      True),
+    'delay_s':   ('delays (s)',       True),
+    'aspirate':  ('aspirates',        False),
+    'dispense':  ('dispenses',        False),
+    'move_to':   ('moves',            False),
+    'tips':      ('tips',             False),
+}
+
+
+
+# gantry travel over the recorded commands, the same way the scheduler
+# measures it: straight inside one labware, over SAFE_Z between labware
+
+def travel(commands):
+    total = 0.0
+    here  = None
+
+    for c in commands:
+        if c.x is None:
+            continue
+        if here is not None:
+            total = total + leg_mm(here[1], (c.x, c.y, c.z), here[0] == c.labware)
+        here = (c.labware, (c.x, c.y, c.z))
+
+    return total
+
+
+
+def measure(path):
+    protocol = run_protocol(path)
+    commands = protocol.commands
+    counts   = commands.counts()
+    delays   = sum(c.seconds for c in commands if c.kind == 'delay')
+
+    return {
+        'seconds':   round(protocol.elapsed, 1),
+        'travel_mm': round(travel(commands)),
+        'delay_s':   round(delays, 1),
+        'aspirate':  counts.get('aspirate', 0),
+        'dispense':  counts.get('dispense', 0),
+        'move_to':   counts.get('move_to', 0),
+        'tips':      counts.get('pick_up_tip', 0),
+    }
+
+
+
+def load_baseline(path=BASELINE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+
+def save_baseline(results, path=BASELINE):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+
+# [(script, metric, baseline, now)] for every metric that got worse
+
+def regressions(results, baseline):
+    worse = []
+    for script, now in results.items():
+        for metric, (_, tolerant) in METRICS.items():
+            before = baseline.get(script, {}).get(metric)
+            if before is None:
+                continue
+            limit = before * (1 + TOLERANCE) if tolerant else before
+            if now[metric] > limit:
+                worse.append((script, metric, before, now[metric]))
+    return worse
+
+
+
+def bench_report(results, baseline):
+    for script, now in results.items():
+        before = baseline.get(script, {})
+        print(f'== {script} ==')
+        print(f'{"":<16} {"baseline":>10} {"now":>10} {"change":>8}')
+
+        for metric, (label, _) in METRICS.items():
+            b = before.get(metric)
+            if b is None:
+                print(f'{label:<16} {"-":>10} {now[metric]:>10g} {"new":>8}')
+                continue
+            change = f'{100 * (now[metric] - b) / b:+.1f}%' if b else ''
+            print(f'{label:<16} {b:>10g} {now[metric]:>10g} {change:>8}')
+        print()
+
+
+
+# measure every script; returns the regressions (and stores the numbers as
+# the new baseline when update is set)
+
+def bench(scripts, update=False):
+    results  = {os.path.basename(path): measure(path) for path in scripts}
+    baseline = load_baseline()
+
+    bench_report(results, baseline)
+
+    if update:
+        save_baseline(dict(baseline, **results))
+        print(f'baseline written to {BASELINE}')
+        return []
+
+    worse = regressions(results, baseline)
+    for script, metric, before, now in worse:
+        print(f'REGRESSION {script}: {METRICS[metric][0]} {before:g} -> {now:g}')
+    return worse
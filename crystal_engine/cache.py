@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of compiled plans.
+
+A plan only depends on the plate spec (well matrix, sources and their
+volumes, settings, deck), the labware JSON next to the protocols and the
+engine code itself, so a hash of those names it. Uploading an unchanged
+protocol again reads the plan back instead of planning (and scheduling) it
+from scratch. Files are evicted oldest-used first once the cache grows past
+MAX_BYTES.
+
+The cache lives in $CRYSTAL_ENGINE_CACHE, /data/user_storage on the robot
+or ~/.cache/crystal_engine anywhere else. Set 'cache': False in a spec to
+skip it. A cache that cannot be written is simply not used.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+
+MAX_BYTES = 20 * 1024 * 1024
+
+
+_engine_digest = None
+
+
+
+def cache_dir():
+    if os.environ.get('CRYSTAL_ENGINE_CACHE'):
+        return os.environ['CRYSTAL_ENGINE_CACHE']
+    if os.path.isdir('/data/user_storage'):
+        return '/data/user_storage/crystal_engine_cache'
+    return os.path.join(os.path.expanduser('~'), '.cache', 'crystal_engine')
+
+
+
+# every source file of the engine, so changing the planner invalidates plans
+
+def engine_digest():
+    global _engine_digest
+
+    if _engine_digest is None:
+        h = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        _engine_digest = h.hexdigest()
+
+    return _engine_digest
+
+
+
+def plan_key(kind, spec):
+    from .labware import custom_definitions    # labware caches its definitions here
+
+    h = hashlib.sha256()
+    h.update(kind.encode())
+    h.update(engine_digest().encode())
+    h.update(json.dumps(custom_definitions(), sort_keys=True).encode())
+    h.update(json.dumps(spec, sort_keys=True, default=repr).encode())
+    return h.hexdigest()
+
+
+
+def _path(key):
+    return os.path.join(cache_dir(), key + '.json')
+
+
+
+def load(key):
+    try:
+        with open(_path(key)) as f:
+            data = json.load(f)
+        os.utime(_path(key))  # mark as used for eviction
+        return data
+    except (OSError, ValueError):
+        return None
+
+
+
+def store(key, data, max_bytes=MAX_BYTES):
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        tmp = _path(key) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, _path(key))
+        evict(max_bytes)
+    except OSError:
+        pass
+
+
+
+# drop the least recently used plans until the cache fits in max_bytes
+
+def evict(max_bytes=MAX_BYTES):
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir(), '*.json')):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total = total - size
+        except OSError:
+            pass
+
+
+
+# compute() through the cache. encode/decode turn its result into plain
+# JSON and back
+
+def cached(kind, spec, compute, encode=lambda x: x, decode=lambda x: x):
+    if not spec.get('cache', True):
+        return compute()
+
+    key  = plan_key(kind, spec)
+    data = load(key)
+    if data is not None:
+        return decode(data)
+
+    result = compute()
+    store(key, encode(result))
+    return result
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints for interrupted plates.
+
+With 'checkpoint' in the spec, run_plate saves where the run is after every
+dispense into a plate and every tip drop: the next step of the plan, the
+tasks that are done (see crystal_engine.graph), what every source tube holds
+by the ledger's count, how many tips each pipette has used and what every
+tip still holds (its cushion, and what is left of a multi-dispense draw).
+Only a tip of well mixture (a BLOCK 3 or drop draw from a well) that is not
+empty yet keeps a point from being saved, that liquid cannot be drawn again.
+
+When the same plan is started again with 'resume': True and a checkpoint is
+there, the run picks up from it instead of from scratch: the robot pauses so
+the partial plate can go back on the deck, every pipette that held a tip gets
+a fresh one and draws again just what the old one held, so a batch carries on
+with the wells it had not reached yet. Tips carry on from where the last run
+stopped and every source depth is worked out from the saved volumes. A
+resumed run saves its own points under the step numbers of the original
+plan. Without 'resume' a saved checkpoint is only reported: the plate starts
+over and its first point replaces the old one. A checkpoint that cannot be
+written is logged and the run goes on. A finished plate removes its
+checkpoint. Nothing is read or written while the protocol is only being
+simulated (on upload, or on the FakeProtocolContext).
+
+Set 'checkpoint' to a path, or to True for $CRYSTAL_ENGINE_CHECKPOINT,
+/data/user_storage/crystal_engine_checkpoint.json on the robot or
+./crystal_engine_checkpoint.json anywhere else.
+"""
+
+import json
+import logging
+import os
+from collections import namedtuple
+
+from .cache import plan_key
+from .deck import channels
+from .engine import DEFAULT_DECK, Step, Target, draw_depths, plates
+from .graph import done_at
+
+
+# a resumed run: steps is what is left of the plan from start, after the
+# steps that give back the tips the pipettes held. sources hold what was
+# saved, tips is {pipette: tips used} and origin the plan index of every one
+# of steps (None for the ones put in front)
+Resume = namedtuple('Resume', ['start', 'steps', 'sources', 'tips', 'origin'])
+
+
+log = logging.getLogger(__name__)
+
+
+
+def checkpoint_path(setting=True):
+    if isinstance(setting, str):
+        return setting
+    if os.environ.get('CRYSTAL_ENGINE_CHECKPOINT'):
+        return os.environ['CRYSTAL_ENGINE_CHECKPOINT']
+    if os.path.isdir('/data/user_storage'):
+        return '/data/user_storage/crystal_engine_checkpoint.json'
+    return 'crystal_engine_checkpoint.json'
+
+
+
+# {index into steps: checkpoint} for every point a run of steps can resume
+# from, the index being that of the step that comes next. Walks the steps
+# once, keeping the ledger, the tip count and what is in every tip. tips is
+# {pipette: tips used} before the first step and origin the plan index of
+# every step, for a resumed run (see resume_plan)
+
+def checkpoints(spec, steps, tips=None, origin=None):
+    deck     = spec.get('deck') or DEFAULT_DECK
+    sources  = spec['sources']
+    on_plate = set(plates(spec))
+    volumes  = {name: src['volume'] * 1000 for name, src in sources.items()}
+    tips     = dict(tips or dict.fromkeys(deck['pipettes'], 0))
+    origin   = list(origin or range(len(steps)))
+    origin   = origin + [origin[-1] + 1 if origin else 0]
+    holding  = {}                                  # {pip: [reagent, uL]} for tips on
+    mixed    = set()                               # pips whose tip holds well mixture
+    points   = {}
+
+    for i, step in enumerate(steps):
+        pip      = step.pipette
+        finished = False
+
+        if step.kind == 'pick_up_tip':
+            tips[pip]    = tips[pip] + channels(deck['pipettes'][pip][0])
+            holding[pip] = [None, 0.0]
+            mixed.discard(pip)
+        elif step.kind == 'drop_tip':
+            holding.pop(pip, None)
+            mixed.discard(pip)
+            finished = True
+        elif step.kind in ('aspirate', 'air_gap'):
+            if step.kind == 'aspirate' and step.reagent in sources:
+                volumes[step.reagent] = volumes[step.reagent] - step.volume * (step.channels or 1)
+                holding[pip][0]       = step.reagent
+            elif step.kind == 'aspirate':
+                mixed.add(pip)
+            holding[pip][1] = holding[pip][1] + step.volume
+        elif step.kind == 'dispense':
+            holding[pip][1] = round(max(holding[pip][1] - step.volume, 0.0), 6)
+            if not holding[pip][1]:
+                mixed.discard(pip)
+            finished = step.target.labware in on_plate
+
+        # after the last step there is nothing left to resume
+        if not finished or mixed or origin[i + 1] is None or i + 1 == len(steps):
+            continue
+
+        points[i + 1] = {
+            'next':    origin[i + 1],
+            'volumes': dict(volumes),
+            'tips':    dict(tips),
+            'holding': {p: list(h) for p, h in holding.items()},
+        }
+
+    return points
+
+
+
+class Checkpoint:
+
+    def __init__(self, path, spec, steps):
+        self.path   = path
+        self.spec   = spec
+        self.steps  = steps
+        self.key    = plan_key('plan', {key: value for key, value in spec.items() if key != 'resume'})
+        self.points = checkpoints(spec, steps)
+        self.done   = done_at(spec, steps)             # {task: the step that finishes it}
+        self.saved  = self.load()
+
+
+    # the run goes on from a Resume: its points come from the steps it really
+    # executes (the prelude included), saved under the plan's step numbers
+    def resume(self, resume):
+        self.points = checkpoints(dict(self.spec, sources=resume.sources), resume.steps, resume.tips,
+                                  resume.origin)
+
+
+    # the saved checkpoint if it belongs to this plan
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('plan') != self.key or saved['next'] >= len(self.steps):
+            return None
+        return saved
+
+
+    def step(self, index, step, seconds):
+        point = self.points.get(index + 1)
+        if point is None:
+            return
+
+        done = [task for task, i in self.done.items() if i < point['next']]
+        self.write(dict(point, plan=self.key, done=sorted(done)))
+
+
+    # a checkpoint that cannot be saved costs the resume point, not the run
+    def write(self, data):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as error:
+            log.warning('could not save the checkpoint to %s: %s', self.path, error)
+
+
+    def close(self):
+        pass
+
+
+    # the plate is done, the next run starts from scratch
+    def finish(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+
+# the checkpoint log for a run_plate call, or None when the spec does not ask
+# for one or the protocol is only being simulated. A saved point is only
+# resumed with 'resume': True; without it the plate starts over (and its first
+# point replaces the old one), loudly either way
+def open_checkpoint(protocol, spec, steps):
+    if not spec.get('checkpoint') or protocol.is_simulating():
+        return None
+
+    checkpoint = Checkpoint(checkpoint_path(spec['checkpoint']), spec, steps)
+    if checkpoint.saved and not spec.get('resume'):
+        log.warning('%s holds an interrupted run of this plate (%d tasks done); starting the plate over, '
+                    "set 'resume': True to carry on from it instead", checkpoint.path, len(checkpoint.saved['done']))
+        checkpoint.saved = None
+    elif checkpoint.saved:
+        log.warning('resuming an interrupted plate from %s at step %d of %d (%d tasks done)', checkpoint.path,
+                    checkpoint.saved['next'], len(steps), len(checkpoint.saved['done']))
+    return checkpoint
+
+
+
+# how to carry on from a saved checkpoint: a fresh tip for every pipette that
+# held one, drawing again what it held (cushion and the rest of its batch)
+def resume_plan(spec, steps, saved):
+    start   = saved['next']
+    block   = steps[start].block
+    sources = {name: dict(src, volume=saved['volumes'][name] / 1000) for name, src in spec['sources'].items()}
+    prelude = []
+
+    for pip, (reagent, uL) in saved['holding'].items():
+        prelude.append(Step(block, 'pick_up_tip', pip))
+        if reagent in sources and uL > 0:
+            last   = next(s for s in reversed(steps[:start]) if s.kind == 'aspirate' and s.pipette == pip)
+            source = sources[reagent]
+            prelude.append(Step(block, 'aspirate', pip, volume=uL, reagent=reagent, channels=last.channels,
+                                target=Target(source['labware'], source['well'], 'top', None)))
+
+    # every source depth from here on comes from the saved volumes
+    todo   = draw_depths(prelude + steps[start:], sources, spec.get('deck') or DEFAULT_DECK)
+    origin = [None] * len(prelude) + list(range(start, len(steps)))
+    return Resume(start, todo, sources, saved['tips'], origin)
+
+
+
+def resume_message(saved):
+    return (f"Resuming an interrupted plate: {len(saved['done'])} tasks are already done. "
+            f"Put the partial plate back, take any tips off the pipettes and continue.")
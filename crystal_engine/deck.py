@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+OT-2 deck geometry for planning and estimating without a robot.
+
+Custom labware comes straight from the JSON definitions that sit next to the
+package (e.g. definitions/hamptonresearch_24_wellplate_24x500ul_JD.json), read
+and checked by crystal_engine.labware. The stock opentrons labware the protocols
+use is described by a small grid table that is close enough to the official
+definitions for travel estimates.
+"""
+
+from math import sqrt
+
+from .labware import custom_definitions, missing
+
+
+# front left corner of every deck slot, mm
+SLOT_ORIGINS = {
+    1:  (0.0,     0.0),  2: (132.5,   0.0),  3: (265.0,   0.0),
+    4:  (0.0,    90.5),  5: (132.5,  90.5),  6: (265.0,  90.5),
+    7:  (0.0,   181.0),  8: (132.5, 181.0),  9: (265.0, 181.0),
+    10: (0.0,   271.5), 11: (132.5, 271.5), 12: (265.0, 271.5),
+}
+
+# where drop_tip goes: the fixed trash in slot 12
+TRASH = (SLOT_ORIGINS[12][0] + 82.84, SLOT_ORIGINS[12][1] + 80.0, 82.0)
+
+# the gantry climbs to this height when it leaves a labware
+SAFE_Z = 140.0
+
+
+# stock labware as regular grids (or explicit wells for the mixed tube rack).
+#   a1:      (x, y) of A1 from the slot corner
+#   pitch:   (column, row) spacing
+#   z:       height of the well tops
+#   depth:   well depth
+#   wells:   {well: (x, y, depth)}, for a rack whose wells differ
+STOCK_LABWARE = {
+    'opentrons_96_filtertiprack_200ul': {
+        'rows': 'ABCDEFGH', 'columns': 12, 'a1': (14.38, 74.24), 'pitch': (9, 9),
+        'z': 64.69, 'depth': 59.3},
+    'opentrons_96_tiprack_300ul': {
+        'rows': 'ABCDEFGH', 'columns': 12, 'a1': (14.38, 74.24), 'pitch': (9, 9),
+        'z': 64.69, 'depth': 59.3},
+    'geb_96_tiprack_10ul': {
+        'rows': 'ABCDEFGH', 'columns': 12, 'a1': (14.38, 74.24), 'pitch': (9, 9),
+        'z': 64.69, 'depth': 34.0},
+    'opentrons_24_tuberack_nest_1.5ml_snapcap': {
+        'rows': 'ABCD', 'columns': 6, 'a1': (18.21, 75.43), 'pitch': (19.89, 19.28),
+        'z': 79.85, 'depth': 37.9},
+    'opentrons_6_tuberack_nest_50ml_conical': {
+        'rows': 'AB', 'columns': 3, 'a1': (35.5, 60.5), 'pitch': (35.0, 35.0),
+        'z': 124.35, 'depth': 113.3},
+    'nest_12_reservoir_15ml': {
+        'rows': 'A', 'columns': 12, 'a1': (14.38, 42.78), 'pitch': (9, 0),
+        'z': 31.4, 'depth': 26.85},
+    'opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical': {
+        'wells': {
+            'A1': (13.88, 67.74, 117.5), 'B1': (13.88, 42.74, 117.5), 'C1': (13.88, 17.74, 117.5),
+            'A2': (38.88, 67.74, 117.5), 'B2': (38.88, 42.74, 117.5), 'C2': (38.88, 17.74, 117.5),
+            'A3': (71.38, 60.24, 113.0), 'B3': (71.38, 25.24, 113.0),
+            'A4': (106.38, 60.24, 113.0), 'B4': (106.38, 25.24, 113.0),
+        },
+        'z': 124.35},
+}
+
+
+_tables = {}
+
+
+
+# {well: (x, y, z_top, depth)} relative to the slot corner for every well of
+# a labware, in the order the definition lists them. Worked out from the
+# definition once per load name; everything below indexes into it
+
+def well_table(load_name):
+    table = _tables.get(load_name)
+    if table is not None:
+        return table
+
+    definitions = custom_definitions()
+    if load_name in definitions:
+        wells = definitions[load_name]['wells']
+        table = {name: (w['x'], w['y'], w['z'] + w['depth'], w['depth'])
+                 for name in (n for group in definitions[load_name]['ordering'] for n in group)
+                 for w in [wells[name]]}
+    elif load_name not in STOCK_LABWARE:
+        raise missing(load_name)
+    else:
+        lw = STOCK_LABWARE[load_name]
+        if 'wells' in lw:
+            table = {name: (x, y, lw['z'], depth) for name, (x, y, depth) in lw['wells'].items()}
+        else:
+            table = {r + str(c): (lw['a1'][0] + lw['pitch'][0] * (c - 1), lw['a1'][1] - lw['pitch'][1] * i,
+                                  lw['z'], lw['depth'])
+                     for c in range(1, lw['columns'] + 1) for i, r in enumerate(lw['rows'])}
+
+    _tables[load_name] = table
+    return table
+
+
+
+# (x, y, z_top, depth) of one well, relative to the slot corner
+
+def well_geometry(load_name, well):
+    return well_table(load_name)[well]
+
+
+
+# wells in the order the labware definition lists them
+
+def well_names(load_name):
+    return list(well_table(load_name))
+
+
+
+# how many tips a pipette model picks up at once
+
+def channels(model):
+    return 8 if '_multi' in model else 1
+
+
+
+# columns an 8-channel pipette can fill in one move: {lead well: [wells front
+# to back]} for every column of 8 wells sitting one channel pitch (9 mm) apart
+# in a straight line. Plates like the (rotated, 19 mm pitch) Hampton plate
+# have none
+
+def multichannel_columns(load_name, pitch=9.0):
+    by_number = {}
+    for well in well_names(load_name):
+        by_number.setdefault(int(well[1:]), []).append(well)
+
+    columns = {}
+    for number, wells in by_number.items():
+        wells = sorted(wells)
+        if len(wells) != 8:
+            continue
+        xy    = [well_geometry(load_name, w)[:2] for w in wells]
+        if all(abs(b[0] - a[0]) < 0.5 and abs(a[1] - b[1] - pitch) < 0.5 for a, b in zip(xy, xy[1:])):
+            columns[wells[0]] = wells
+
+    return columns
+
+
+
+# slots a labware covers. Anything deeper than a slot (like the Hampton plate,
+# 175 mm front to back) also covers the slot behind it, which for slots 10-12
+# is off the deck and for slot 9 is the trash
+
+def footprint(load_name, slot):
+    definition = custom_definitions().get(load_name)
+    depth      = definition['dimensions']['yDimension'] if definition else 85.5
+
+    if depth > SLOT_ORIGINS[4][1]:
+        return [slot, slot + 3]
+    return [slot]
+
+
+
+# free slots a labware could go into without overhanging anything
+
+def fits(deck, load_name):
+    free = set(free_slots(deck))
+    return [slot for slot in sorted(free) if free.issuperset(footprint(load_name, slot))]
+
+
+
+# deck slots nothing is loaded on (or hanging over); 12 is the trash
+
+def free_slots(deck):
+    used = set()
+    for load_name, slot in deck['labware'].values():
+        used.update(footprint(load_name, slot))
+    return [slot for slot in range(1, 12) if slot not in used]
+
+
+
+# absolute deck position of a well reference point
+
+def position(load_name, slot, well, ref='top', z=0, x=0, y=0):
+    wx, wy, top, depth = well_table(load_name)[well]
+    ox, oy             = SLOT_ORIGINS[slot]
+
+    if ref == 'bottom':
+        wz = top - depth
+    elif ref == 'center':
+        wz = top - depth / 2
+    else:
+        wz = top
+
+    return ox + wx + x, oy + wy + y, wz + z
+
+
+
+# how far the gantry goes from a to b. Inside one labware it goes straight
+# there, between labware it climbs to SAFE_Z, crosses and comes back down
+
+def leg_mm(a, b, same_labware=True):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    flat   = sqrt(dx * dx + dy * dy)
+
+    if same_labware:
+        return sqrt(flat * flat + (b[2] - a[2]) ** 2)
+
+    return max(SAFE_Z - a[2], 0) + flat + max(SAFE_Z - b[2], 0)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Settle delays keyed by action and liquid class.
+
+The scripts used to protocol.delay() the same fixed amount after every
+pick_up_tip, aspirate, move_to and dispense. A DelayPolicy only waits where the
+liquid needs it: viscous precipitant settles after every aspirate, water
+never waits after a move. Each source names its class in the spec, a source
+that does not is a 'buffer':
+
+    'precip': {'labware': 'colors', 'well': 'B2', ..., 'liquid': 'viscous'}
+"""
+
+
+# the class of a source that does not name one
+DEFAULT_CLASS = 'buffer'
+
+
+# seconds to wait after each kind of step, per liquid class. Missing entries
+# mean no wait. 'reservoir' is the mixed well contents (BLOCK 3 and the
+# reservoir half of a drop)
+ADAPTIVE_DELAYS = {
+    'water':     {'aspirate': 0.1,  'dispense': 0.1},
+    'buffer':    {'aspirate': 0.25, 'dispense': 0.1},
+    'viscous':   {'aspirate': 1.0,  'dispense': 0.5},
+    'protein':   {'aspirate': 0.5,  'dispense': 0.25},
+    'reservoir': {'aspirate': 0.25, 'dispense': 0.25, 'touch_tip': 0.1},
+}
+
+
+
+def liquid_class(reagent, sources):
+    if reagent is None:
+        return 'reservoir'
+    return sources.get(reagent, {}).get('liquid') or DEFAULT_CLASS
+
+
+
+class DelayPolicy:
+
+    # table is {liquid_class: {step kind: seconds}}. With fixed set, every
+    # step but drop_tip waits that long no matter the liquid, and so does a
+    # tip swapped in the middle of BLOCK 1, which is how the scripts always
+    # behaved
+    def __init__(self, table=None, sources=None, fixed=None):
+        self.table   = table or {}
+        self.sources = sources or {}
+        self.fixed   = fixed
+
+
+    def seconds(self, kind, reagent=None):
+        if self.fixed is not None:
+            return 0 if kind == 'drop_tip' else self.fixed
+
+        return self.table.get(liquid_class(reagent, self.sources), {}).get(kind, 0)
+
+
+    # the wait after a tip is dropped to be swapped for a fresh one. The
+    # scripts only had it in BLOCK 1 (drop_tip, delay, pick_up_tip)
+    def swap_seconds(self, block):
+        return self.fixed if self.fixed is not None and block == 1 else 0
+
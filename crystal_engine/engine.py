@@ -0,0 +1,955 @@
+# -*- coding: utf-8 -*-
+"""
+Shared protocol engine for the 24 (and 96) well crystallization plates.
+
+A protocol script hands the engine a plate spec (a plain dict) and the engine
+does the rest: it plans the full aspirate/move/dispense sequence up front and
+then executes it against an opentrons ProtocolContext. The plate spec looks
+like this:
+
+    spec = {
+        'wells':            ['A1', 'A2', ...],           # order to visit
+        'orders':           {1: [...], 4: [...]},        # optional per block order
+        'well_information': make_plate(wells),           # {well: {reagent: uL}}
+        'sources': {                                     # where every liquid lives
+            'buffer46': {'labware': 'colors', 'well': 'A3',
+                         'vial': 'GREINER_50mL', 'volume': 40},   # mL
+            ...
+        },
+        'reservoir': ['buffer46', 'buffer47', 'precip'], # BLOCK 1, p300 only
+        'distribute': True,                              # BLOCK 1 multi-dispense
+        'clean_tips': ['buffer46', 'buffer47'],          # tips that must stay uncontaminated
+        'water':     {'reagent': 'water'},               # BLOCK 2, pipette picked per volume
+        'mix':       False,                              # BLOCK 3 pass (True), or 'last' (see mix_mode)
+        'multichannel': 'p300m',                         # 8-channel for column moves (BLOCK 1/2)
+        'protein':   'protein',                          # BLOCK 4 drop source
+        'liquids':   LIQUIDS,                            # rates, air gaps, settle delays per liquid class
+        'delays':    ADAPTIVE_DELAYS,                    # optional, overrides the registry's delays
+        'interleave': True,                              # drops as soon as their well is done
+        'compact':   True,                               # drop move_to steps the robot's own path covers
+        'telemetry': True,                               # JSON-lines step log, or a path for it
+        'checkpoint': True,                              # save where the plate is, or a path for it
+        'resume':    False,                              # True carries on from an interrupted run's checkpoint
+        'settings':  {...},                              # overrides DEFAULT_SETTINGS and the plate's
+        'deck':      {...},                              # overrides DEFAULT_DECK
+    }
+
+A batch of plates (see crystal_engine.batch) adds 'plates': {labware name:
+{'wells', 'well_information', 'orders'}} in run order; those keys then come
+from each plate instead of the top level. Every reagent goes into all plates
+before the next source is opened, and the drops are set plate by plate.
+"""
+
+import time
+from collections import namedtuple
+from itertools import combinations
+from math import ceil, pi, cos, sin
+
+try:
+    from opentrons import types
+except ImportError:
+    # planning and estimating offline, see crystal_engine.simulate
+    from .simulate import types
+
+from .vials import vial_depths
+from .delays import DelayPolicy, liquid_class
+from .liquids import liquid_delays
+from .deck import channels, multichannel_columns, well_geometry, well_names
+from .labware import MIX_DIP, LabwareError, check_targets, load_labware, plate_settings
+from .simulate import DROP_TIP, PICK_UP_TIP, PIPETTES
+from .tips import with_tip_racks
+
+
+# where a pipette should go. ref is one of 'top', 'bottom' or 'center' of the
+# well and (x, y, z) is the offset from that reference point
+Target = namedtuple('Target', ['labware', 'well', 'ref', 'z', 'x', 'y'],
+                    defaults=[0, 0])
+
+# one command for the robot. Plans are lists of these so they can be inspected,
+# printed or replayed without a robot attached. An 8-channel step has
+# channels=8, its volume is per channel and its well is the lead (row A) well
+Step = namedtuple('Step', ['block', 'kind', 'pipette', 'volume', 'target', 'rate',
+                           'seconds', 'radius', 'reagent', 'well', 'channels'],
+                  defaults=[None] * 9)
+
+
+# a plan that needs a pipette the deck does not have
+class PipetteError(ValueError):
+    pass
+
+
+# Steps as plain lists and back, for JSON (see crystal_engine.cache)
+
+def encode_steps(steps):
+    return [[*step[:4], list(step.target) if step.target else None, *step[5:]] for step in steps]
+
+
+def decode_steps(rows):
+    return [Step(*row[:4], Target(*row[4]) if row[4] else None, *row[5:]) for row in rows]
+
+
+
+DEFAULT_SETTINGS = {
+    'height':               10,    # come comically far above the well for safety
+    'depth':               -11,    # how far into resivour to go to dipsense liquid (or the plate's own)
+    'offset':               5.5,   # mm, distance away from center  to resivour (or the plate's own)
+    'delay':                0.25,  # sec, slow robot down for liquid's benefit
+    'const_vol_in_p300':    20,    # constant volume in the p300 for reverse pipette mimic
+    'p300_tip_size':        200,   # pipette tip size uL
+    'const_vol_in_p10':     2,     # constant volume in the p10 for reverse pipette mimic
+    'p10_tip_size':         10,    # pipette tip size uL
+    'p10_min_vol':          1,     # uL, smallest volume the p10 is accurate for
+    'p300_min_vol':         20,    # uL, smallest volume the p300 is accurate for
+    'p300m_min_vol':        20,    # uL, the same for each channel of the 8-channel p300
+    'const_vol_in_p300m':   20,    # constant volume in each channel of the 8-channel p300
+    'p300m_tip_size':       200,   # pipette tip size uL
+    'reservoir_rate':       0.8,   # relative dispense rate into the resivour
+    'num_laps':             9,     # number of stops/checks for mixing in resivour
+    'mix_rate':             1,     # relative dispense rate while mixing
+    'lap_delay':            0.1,   # sec, pause between mixing stops
+    'growth_well_half_vol': 2.5,   # volume of the resivour or pure protein in growth well
+    'drop_factor':          2.5,   # dispense a little extra to empty the tip
+    'drop_rate':            0.5,   # relative dispense rate into the growth well
+    'xtal_well_depth':     -1.5,   # the depth (mm) to go down to get into the growth well (ditto, None: no drop)
+}
+
+
+DEFAULT_DECK = {
+    'labware': {
+        'tips_300ul':    ('opentrons_96_filtertiprack_200ul', 4),
+        'tips_10ul':     ('geb_96_tiprack_10ul', 1),
+        'colors':        ('opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical', 2),
+        'crystal_plate': ('hamptonresearch_24_wellplate_24x500ul_jd', 3),
+        'protein':       ('opentrons_24_tuberack_nest_1.5ml_snapcap', 5),
+    },
+    'pipettes': {
+        'p300': ('p300_single_gen2', 'right', ['tips_300ul']),
+        'p10':  ('p10_single', 'left', ['tips_10ul']),
+    },
+}
+
+
+# 96 well sitting drop screens: the 8-channel p300 fills every column that is
+# the same all the way down from a 12 well reservoir, the single channel p300
+# does the rest. There is no mount left for a p10 and the definition has no
+# drop well, so this deck only fills the reservoirs: leave 'protein' out.
+# Depth and offset come from the plate's definition (labware.plate_settings)
+DECK_96 = {
+    'labware': {
+        'tips_300ul_multi': ('opentrons_96_filtertiprack_200ul', 1),
+        'troughs':          ('nest_12_reservoir_15ml', 2),
+        'crystal_plate':    ('sittingdrop_96_wellplate_96x100ul_jd', 3),
+        'tips_300ul':       ('opentrons_96_filtertiprack_200ul', 4),
+    },
+    'pipettes': {
+        'p300m': ('p300_multi_gen2', 'left', ['tips_300ul_multi']),
+        'p300':  ('p300_single_gen2', 'right', ['tips_300ul']),
+    },
+}
+
+
+PLATE = 'crystal_plate'
+
+MIX_MODES = ('pass', 'last')
+
+
+
+# every point the blocks visit in one plate well, as Targets:
+#   above      the safe spot settings['height'] over the reservoir
+#   reservoir  where the reservoir is dispensed (and the drop draws from)
+#   dip        the top of the reservoir, on the way down for the drop draw
+#   mix        where BLOCK 3 draws the reservoir back up
+#   drop       the growth well on the post, and touch the tap over it (None
+#              for a plate without a drop well)
+#   ring_above, ring, mix_ring
+#              one per lap stop: over it, at dispense depth and at mix depth
+WellPlaces = namedtuple('WellPlaces', ['above', 'reservoir', 'dip', 'mix', 'drop', 'touch',
+                                       'ring_above', 'ring', 'mix_ring'])
+
+
+# {well: WellPlaces} for the wells of one plate. The planner builds this once
+# per plate and indexes into it, and the executor resolves every Target only
+# once (see Locations), so no block rebuilds the same point for every split
+# run and every lap
+
+def well_places(settings, plate, wells, laps):
+    s       = settings
+    places  = {}
+    cupless = s['xtal_well_depth'] is None
+
+    for well in wells:
+        places[well] = WellPlaces(
+            above      = Target(plate, well, 'top', s['height'], 0, s['offset']),
+            reservoir  = Target(plate, well, 'center', s['depth'], 0, s['offset']),
+            dip        = Target(plate, well, 'top', s['depth'], 0, s['offset']),
+            mix        = Target(plate, well, 'center', s['depth'] - MIX_DIP, 0, s['offset']),
+            drop       = None if cupless else Target(plate, well, 'center', s['xtal_well_depth'], 0, 0),
+            touch      = None if cupless else Target(plate, well, 'top', s['xtal_well_depth'] - 2.5),
+            ring_above = [Target(plate, well, 'top', s['height'], x, y) for x, y in laps],
+            ring       = [Target(plate, well, 'center', s['depth'], x, y) for x, y in laps],
+            mix_ring   = [Target(plate, well, 'center', s['depth'] - MIX_DIP, x, y) for x, y in laps],
+        )
+
+    return places
+
+
+
+# the settings a plan runs with: DEFAULT_SETTINGS, then the plate's own
+# (crystal_engine.labware), then the spec's
+
+def plan_settings(spec):
+    deck     = spec.get('deck') or DEFAULT_DECK
+    plate    = deck['labware'].get(PLATE)
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(plate_settings(plate[0]) if plate else {})
+    settings.update(spec.get('settings', {}))
+    return settings
+
+
+
+# {labware name: plate} for every plate in the run. A single plate spec keeps
+# its wells, orders and well_information at the top level
+
+def plates(spec):
+    return spec.get('plates') or {PLATE: spec}
+
+
+
+# how the reservoir gets mixed, from spec['mix']: None, 'pass' (True) for the
+# BLOCK 3 aspirate and redispense round every well, or 'last' to spread the
+# last component that goes into a well over the lap stops as it is dispensed
+
+def mix_mode(spec):
+    mix = spec.get('mix')
+    if not mix:
+        return None
+    mode = 'pass' if mix is True else mix
+    if mode not in MIX_MODES:
+        raise ValueError(f"unknown mix {mix!r}, use one of {MIX_MODES}")
+    return mode
+
+
+
+# (x, y) of the num_laps stops around the drop post, half way round from +x.
+# They are the same for every well, so a plan works them out once
+
+def lap_points(settings):
+    slices = pi / settings['num_laps']
+    return [(cos(-slices * lap) * settings['offset'], sin(-slices * lap) * settings['offset'])
+            for lap in range(settings['num_laps'])]
+
+
+
+# keeps track of everything the planner needs while it walks the plate:
+# the steps so far, what each source tube holds and which pipettes have tips
+
+class PlanBuilder:
+
+    def __init__(self, spec):
+        self.spec     = spec
+        self.settings = plan_settings(spec)
+        self.sources  = spec['sources']
+        self.steps    = []
+        self.contents = {}     # {(plate, well): {reagent: uL}} dispensed so far
+        self.plates   = plates(spec)
+        self.plate    = PLATE
+        self.block    = None
+        self.deck     = spec.get('deck') or DEFAULT_DECK
+        self.multi    = spec.get('multichannel')
+        self.channels = {pip: channels(model) for pip, (model, _, _) in self.deck['pipettes'].items()}
+        self.has_tip  = dict.fromkeys(self.channels, False)
+        self.dirty    = dict.fromkeys(self.channels, False)
+        self.liquids  = spec.get('liquids') or {}
+        self.gap      = {}     # {pip: uL of air gap in front of the liquid}
+        self.mix      = mix_mode(spec)
+        self.laps     = lap_points(self.settings)
+        self.places   = {}     # {plate: {well: WellPlaces}}, see well_places
+
+        # convert to uL from mL
+        self.volumes  = {name: src['volume'] * 1000 for name, src in self.sources.items()}
+
+        # without a delay table, wait settings['delay'] after every step like
+        # the scripts always did
+        delays = spec.get('delays') or liquid_delays(self.liquids)
+        if delays:
+            self.delays = DelayPolicy(delays, self.sources)
+        else:
+            self.delays = DelayPolicy(fixed=self.settings['delay'])
+
+
+    # the wells of the current plate in the order the current block should visit them
+    def wells(self):
+        plate = self.plates[self.plate]
+        return plate.get('orders', {}).get(self.block) or plate['wells']
+
+
+    def well_information(self):
+        return self.plates[self.plate]['well_information']
+
+
+    # the WellPlaces of a well of the current plate. Every point has to be
+    # inside its well (LabwareError otherwise)
+    def place(self, well):
+        places = self.places.get(self.plate)
+        if places is None:
+            load_name = self.deck['labware'][self.plate][0]
+            places    = well_places(self.settings, self.plate, well_names(load_name), self.laps)
+            check_targets(load_name, [t for p in places.values() for t in [*p[:6], *p.ring_above, *p.ring,
+                                                                            *p.mix_ring] if t is not None])
+            self.places[self.plate] = places
+        return places[well]
+
+
+    # the wells one dispense of pip at well lands in: the whole column for an
+    # 8-channel, which always goes to the lead well
+    def covered(self, pip, well):
+        if self.channels.get(pip, 1) == 1:
+            return [well]
+        return multichannel_columns(self.deck['labware'][self.plate][0])[well]
+
+
+    # split one plate's [(well, uL)] into column moves [(lead well, uL)] for the
+    # multichannel and the wells a single channel has to do. A column goes to
+    # the multichannel when every one of its wells gets the same volume
+    def column_moves(self, transfers):
+        if not self.multi:
+            return [], transfers
+
+        columns  = multichannel_columns(self.deck['labware'][self.plate][0])
+        lead_of  = {well: lead for lead, wells in columns.items() for well in wells}
+        volumes  = dict(transfers)
+        moves    = []
+        by_multi = set()
+
+        for well, w_volume in transfers:
+            lead = lead_of.get(well)
+            if lead is None or lead in by_multi:
+                continue
+            if all(volumes.get(w) == w_volume for w in columns[lead]):
+                moves.append((lead, w_volume))
+                by_multi.add(lead)
+
+        singles = [(w, v) for w, v in transfers if lead_of.get(w) not in by_multi]
+        return moves, singles
+
+
+    # (plate, well) for every well of every plate, one plate after the other
+    def plate_wells(self):
+        for plate in self.plates:
+            self.plate = plate
+            for well in self.wells():
+                yield plate, well
+
+
+    def emit(self, kind, pipette=None, **kwargs):
+        self.steps.append(Step(self.block, kind, pipette, **kwargs))
+
+        # slow robot down for liquid's benefit
+        seconds = self.delays.seconds(kind, kwargs.get('reagent'))
+        if seconds:
+            self.steps.append(Step(self.block, 'delay', seconds=seconds))
+
+
+    def pick_up_tip(self, pip):
+        if self.has_tip[pip]:
+            self.drop_tip(pip)
+            seconds = self.delays.swap_seconds(self.block)
+            if seconds:
+                self.steps.append(Step(self.block, 'delay', seconds=seconds))
+        self.emit('pick_up_tip', pip)
+        self.has_tip[pip] = True
+        self.dirty[pip]   = False
+
+
+    def drop_tip(self, pip):
+        if self.has_tip.get(pip):
+            self.emit('drop_tip', pip)
+            self.has_tip[pip] = False
+
+
+    # the registry's LiquidClass for a reagent (None is the mixed reservoir),
+    # or None when the spec has no registry
+    def liquid(self, reagent):
+        return self.liquids.get(liquid_class(reagent, self.sources))
+
+
+    # the rate for kind of a reagent: a rate setting the spec sets itself
+    # (reservoir_rate, mix_rate, drop_rate), else the registry's class, else
+    # the default setting
+    def rate(self, reagent, kind, setting=None):
+        liquid = self.liquid(reagent)
+        if setting in self.spec.get('settings', {}) or liquid is None:
+            return self.settings[setting] if setting else None
+        return getattr(liquid, kind + '_rate')
+
+
+    # what one tip load of reagent holds next to the cushion and the air gap
+    def tip_capacity(self, pip, reagent):
+        s        = self.settings
+        liquid   = self.liquid(reagent)
+        capacity = s[pip + '_tip_size'] - s['const_vol_in_' + pip] - (liquid.air_gap if liquid else 0)
+        if capacity <= 0:
+            raise ValueError(f'{pip} has no room for {reagent} next to its cushion and air gap')
+        return capacity
+
+
+    # update and track the volume in the source tube. The depth itself is
+    # filled in by draw_depths once the whole run is known
+    def draw(self, pip, reagent, volume, well=None):
+        source                = self.sources[reagent]
+        self.volumes[reagent] = self.volumes[reagent] - volume * self.channels[pip]
+        target                = Target(source['labware'], source['well'], 'top', None)
+        self.emit('aspirate', pip, volume=volume, target=target, reagent=reagent, well=well,
+                  rate=self.rate(reagent, 'aspirate'), channels=self.channels[pip])
+
+        # viscous liquid clings to the outside of the tip, tap it off on the tube wall
+        liquid = self.liquid(reagent)
+        if liquid is not None and liquid.touch_tip:
+            v_offset, radius = liquid.touch_tip
+            self.emit('touch_tip', pip, radius=radius, reagent=reagent,
+                      target=Target(source['labware'], source['well'], 'top', v_offset))
+
+
+    # a draw on its way to the plate holds the liquid up with an air gap; the
+    # next dispense pushes it out first
+    def air_gap(self, pip, reagent):
+        liquid = self.liquid(reagent)
+        if liquid is not None and liquid.air_gap:
+            self.emit('air_gap', pip, volume=liquid.air_gap, reagent=reagent)
+            self.gap[pip] = liquid.air_gap
+
+
+    # to mimic reverse pipetting, keep a constant volume in the tip
+    def load_cushion(self, pip, reagent):
+        self.pick_up_tip(pip)
+        self.draw(pip, reagent, self.settings['const_vol_in_' + pip], well=None)
+
+
+    # a clean tip reagent's tip is spoiled by going into a well that already
+    # holds something else; it may not go back into the source after that
+    def spoils_tip(self, reagent, well, pip='p300'):
+        if reagent not in self.spec.get('clean_tips', []):
+            return False
+        return any(r != reagent and v > 0 for w in self.covered(pip, well)
+                   for r, v in self.contents.get((self.plate, w), {}).items())
+
+
+    # is reagent the last thing every well of this dispense gets (the water
+    # of BLOCK 2 comes after everything of BLOCK 1)
+    def is_last(self, pip, reagent, well):
+        water = (self.spec.get('water') or {}).get('reagent')
+        order = list(self.spec['reservoir']) + [water]
+        info  = self.well_information()
+        return all([r for r in order if info[w].get(r, 0) > 0][-1:] == [reagent]
+                   for w in self.covered(pip, well))
+
+
+    def dispense_reservoir(self, pip, reagent, well, volume):
+        if self.spoils_tip(reagent, well, pip):
+            self.dirty[pip] = True
+
+        dispense = dict(well=well, reagent=reagent, rate=self.rate(reagent, 'dispense', 'reservoir_rate'),
+                        channels=self.channels[pip])
+        gap      = self.gap.pop(pip, 0)
+
+        stops = self.ring_stops(pip, volume) if self.mix == 'last' and self.is_last(pip, reagent, well) else 1
+        if stops > 1:
+            self.ring_dispense(pip, well, volume, gap, dispense, stops)
+        else:
+            self.emit('dispense', pip, volume=volume + gap, target=self.place(well).reservoir, **dispense)
+
+        for w in self.covered(pip, well):
+            well_contents          = self.contents.setdefault((self.plate, w), {})
+            well_contents[reagent] = well_contents.get(reagent, 0) + volume
+
+
+    # how many lap stops volume can be spread over with every share at least
+    # the pipette's smallest accurate volume. A well without a post (offset 0)
+    # has no ring to go round
+    def ring_stops(self, pip, volume):
+        if not self.settings['offset']:
+            return 1
+        return max(1, min(len(self.laps), int(volume / self.settings[pip + '_min_vol'] + 1e-9)))
+
+
+    # mix while the last component goes in: its volume is spread over stops
+    # of the lap stops around the drop post (evenly round, when there is not
+    # enough for all of them) instead of landing in one spot, the same ring
+    # BLOCK 3 redispenses on
+    def ring_dispense(self, pip, well, volume, gap, dispense, stops):
+        s      = self.settings
+        share  = volume / stops
+        places = self.place(well)
+        ring   = [places.ring[round(stop * len(self.laps) / stops)] for stop in range(stops)]
+
+        # come down over the first stop to keep clear of the drop post
+        self.emit('move_to', pip, target=places.ring_above[0], reagent=dispense['reagent'], well=well)
+
+        for stop, target in enumerate(ring):
+            if stop == stops - 1:
+                self.emit('dispense', pip, volume=share, target=target, **dispense)
+                continue
+            self.steps.append(Step(self.block, 'dispense', pip, volume=share + (gap if stop == 0 else 0),
+                                   target=target, **dispense))
+            self.steps.append(Step(self.block, 'delay', seconds=s['lap_delay']))
+
+
+    def above(self, well):
+        return self.place(well).above
+
+
+    # if we need to pull out more than the tip holds (such as 400 uL run), split
+    # it up into N number of equal volumes. So 400 uL water is 3x133uL waters
+    # when the tip keeps a 20 uL cushion
+    def fill_reservoir(self, pip, reagent, well, w_volume):
+        max_real_vol = self.tip_capacity(pip, reagent)
+        runs         = ceil(w_volume / max_real_vol)
+        volume       = w_volume / runs
+
+        for run in range(runs):
+            # a spoiled tip gets swapped before it goes back to the source
+            if self.dirty[pip]:
+                self.load_cushion(pip, reagent)
+
+            self.draw(pip, reagent, volume, well)
+            self.air_gap(pip, reagent)
+            self.emit('move_to', pip, target=self.above(well), reagent=reagent, well=well)
+            self.dispense_reservoir(pip, reagent, well, volume)
+            self.emit('move_to', pip, target=self.above(well), reagent=reagent, well=well)
+
+
+    # multi-dispense: one draw from the source tube for several wells in a row.
+    # batch is a list of (well, volume) that together fit in the tip
+    def distribute_reservoir(self, pip, reagent, batch):
+        if self.dirty[pip]:
+            self.load_cushion(pip, reagent)
+
+        self.draw(pip, reagent, sum(v for _, v in batch), batch[0][0])
+        self.air_gap(pip, reagent)
+
+        for well, volume in batch:
+            self.emit('move_to', pip, target=self.above(well), reagent=reagent, well=well)
+            self.dispense_reservoir(pip, reagent, well, volume)
+            self.emit('move_to', pip, target=self.above(well), reagent=reagent, well=well)
+
+
+
+# pack consecutive (well, volume) pairs into batches that fit in one tip load.
+# Anything bigger than a tip on its own gets a batch to itself and is split
+# into equal runs by fill_reservoir like before
+
+def aliquot_batches(transfers, capacity):
+    batches = []
+    batch   = []
+    total   = 0
+
+    for well, volume in transfers:
+        if volume > capacity:
+            if batch:
+                batches.append(batch)
+            batches.append([(well, volume)])
+            batch, total = [], 0
+            continue
+
+        if total + volume > capacity:
+            batches.append(batch)
+            batch, total = [], 0
+
+        batch.append((well, volume))
+        total = total + volume
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+
+### BLOCK 1 ###
+# buffers and precipitant with the p300, one tip per reagent. A clean tip
+# reagent keeps its tip for as long as it only goes into wells holding nothing
+# but itself, so the same buffer chains across rows of empty wells. With
+# 'distribute' on, every tip's run of wells is filled in as few draws as the
+# tip allows instead of one source trip per well. In a batch of plates a
+# reagent goes into every plate before the next source, and its tip carries
+# on into the next plate (one draw never serves two plates)
+
+# transfers is [(plate, well, uL)] for one reagent in visit order; for an
+# 8-channel pip the wells are lead wells of whole columns
+
+def fill_wells(b, pip, reagent, transfers):
+    distribute = b.spec.get('distribute', False)
+    capacity   = b.tip_capacity(pip, reagent)
+
+    # split the wells into runs that share a tip; a run ends on the well
+    # that spoils the tip
+    tip_runs = [[]]
+
+    for plate, well, w_volume in transfers:
+        b.plate = plate
+        tip_runs[-1].append((plate, well, w_volume))
+        if b.spoils_tip(reagent, well, pip):
+            tip_runs.append([])
+
+    tip_runs = [run for run in tip_runs if run]
+
+    for run in tip_runs:
+        b.load_cushion(pip, reagent)
+
+        for plate in dict.fromkeys(p for p, _, _ in run):
+            b.plate   = plate
+            transfers = [(well, w_volume) for p, well, w_volume in run if p == plate]
+
+            if not distribute:
+                for well, w_volume in transfers:
+                    b.fill_reservoir(pip, reagent, well, w_volume)
+                continue
+
+            for batch in aliquot_batches(transfers, capacity):
+                if len(batch) == 1:
+                    b.fill_reservoir(pip, reagent, *batch[0])
+                else:
+                    b.distribute_reservoir(pip, reagent, batch)
+
+    b.drop_tip(pip)
+
+
+
+# with a 'multichannel' pipette, every column that gets the same volume all
+# the way down is one 8-channel move; only the odd wells out go by p300
+
+def reservoir_block(b):
+    b.block = 1
+
+    for reagent in b.spec['reservoir']:
+        columns = []
+        singles = []
+
+        for plate in b.plates:
+            b.plate          = plate
+            well_information = b.well_information()
+
+            # if we have no working volume (i.e. add 0 of a buffer), do nothing
+            transfers        = [(well, well_information[well].get(reagent, 0)) for well in b.wells()
+                                if well_information[well].get(reagent, 0) != 0]
+            moves, rest      = b.column_moves(transfers)
+            columns.extend((plate, well, w_volume) for well, w_volume in moves)
+            singles.extend((plate, well, w_volume) for well, w_volume in rest)
+
+        if columns:
+            fill_wells(b, b.multi, reagent, columns)
+        if singles:
+            fill_wells(b, 'p300', reagent, singles)
+
+
+
+### BLOCK 2 ###
+# we need a special water loop because it's an awkward range (0-50). Every
+# transfer goes to the single channel pipette that does it fastest inside its
+# accuracy envelope (see water_pipettes), or by column with the old
+# 'p300_max_column'. Each pipette keeps one tip unless water is a clean tip
+# reagent and its tip gets spoiled
+
+# seconds one source -> well -> source trip costs on top of the pipetting,
+# and what it takes to bring one more pipette in (tip, cushion, drop)
+WATER_TRIP  = 4.0
+WATER_SETUP = PICK_UP_TIP + DROP_TIP + WATER_TRIP
+
+# a volume below a pipette's '<pip>_min_vol' only goes there if nothing else can take it
+OUT_OF_RANGE = 1e6
+
+
+
+# seconds pip needs for a w_volume transfer split into equal runs that fit
+# its tip, plus OUT_OF_RANGE when the runs are below its minimum volume
+
+def transfer_seconds(b, pip, reagent, w_volume):
+    _, aspirate, dispense = PIPETTES[b.deck['pipettes'][pip][0]]
+    runs                  = ceil(w_volume / b.tip_capacity(pip, reagent))
+    seconds               = runs * WATER_TRIP + w_volume / aspirate + w_volume / dispense
+
+    if w_volume / runs < b.settings.get(pip + '_min_vol', 0):
+        seconds = seconds + OUT_OF_RANGE
+    return seconds
+
+
+
+# the single channel pipette for every volume: each set of pipettes that
+# could be loaded gives every volume to its fastest member, and the set with
+# the lowest total (setup included) wins, so a pipette that would only save a
+# few seconds is never loaded for them
+
+def water_pipettes(b, reagent, volumes):
+    singles = [pip for pip, n in b.channels.items() if n == 1 and pip + '_tip_size' in b.settings]
+    best    = None
+
+    if not volumes:
+        return []
+    if not singles:
+        raise PipetteError(f'{len(volumes)} {reagent} transfers need a single channel pipette, the deck only has '
+                           f'{", ".join(b.channels)}')
+
+    for n in range(1, len(singles) + 1):
+        for chosen in combinations(singles, n):
+            picks = [min(chosen, key=lambda pip: transfer_seconds(b, pip, reagent, v)) for v in volumes]
+            total = n * WATER_SETUP + sum(transfer_seconds(b, pip, reagent, v) for pip, v in zip(picks, volumes))
+            if best is None or total < best[0]:
+                best = (total, picks)
+
+    return best[1]
+
+
+
+def water_block(b):
+    b.block          = 2
+    water            = b.spec['water']
+    reagent          = water['reagent']
+    transfers        = []
+
+    # columns with the same water all the way down go by the multichannel,
+    # the single channel pipettes are picked below
+    for plate in b.plates:
+        b.plate          = plate
+        well_information = b.well_information()
+        moves, rest      = b.column_moves([(w, well_information[w][reagent])
+                                           for w in b.wells() if well_information[w].get(reagent, 0) > 0])
+        transfers.extend((plate, b.multi, w, w_volume) for w, w_volume in moves)
+        transfers.extend((plate, None, w, w_volume) for w, w_volume in rest)
+
+    singles = [t for t in transfers if t[1] is None]
+    if 'p300_max_column' in water:
+        picks = iter('p300' if int(w[1:]) <= water['p300_max_column'] else 'p10' for _, _, w, _ in singles)
+    else:
+        picks = iter(water_pipettes(b, reagent, [v for _, _, _, v in singles]))
+    transfers = [(plate, pip or next(picks), w, v) for plate, pip, w, v in transfers]
+
+    # only load up the pipettes this run will actually need
+    for pip in b.channels:
+        if any(p == pip for _, p, _, _ in transfers):
+            b.load_cushion(pip, reagent)
+
+    for plate, pip, well, w_volume in transfers:
+        b.plate = plate
+        b.fill_reservoir(pip, reagent, well, w_volume)
+
+    for pip in b.channels:
+        b.drop_tip(pip)
+
+
+
+### BLOCK 3 ###
+# Pick up and redistribute the reservior to have a more uniform bath. The tip
+# carries a little of one well's mixture into the next, so it is only kept
+# when the next well holds exactly the same reservoir
+
+def mix_block(b):
+    b.block  = 3
+    s        = b.settings
+    tip_size = s['p300_tip_size']
+    num_laps = s['num_laps']
+    mix_rate = b.rate(None, 'dispense', 'mix_rate')
+
+    # calc our dispense volume and number of dispenses
+    roundingDigits = 1
+    circ_vol       = round(tip_size / num_laps, roundingDigits)
+
+    previous = None
+
+    for plate, well in b.plate_wells():
+        mixture = b.contents.get((plate, well))
+        if not b.has_tip['p300'] or mixture != previous:
+            b.pick_up_tip('p300')
+        previous = mixture
+
+        places = b.place(well)
+        b.emit('move_to', 'p300', target=places.above, well=well)
+        b.emit('aspirate', 'p300', volume=tip_size, well=well, rate=b.rate(None, 'aspirate'), target=places.mix)
+        b.emit('move_to', 'p300', target=places.above, well=well)
+
+        for lap, target in enumerate(places.mix_ring):
+            # if this is our first entry, move above the well into a good position to prevent collision
+            if lap == 0:
+                b.steps.append(Step(b.block, 'move_to', 'p300', target=places.ring_above[0], well=well))
+                b.steps.append(Step(b.block, 'delay', seconds=s['lap_delay']))
+
+            b.steps.append(Step(b.block, 'dispense', 'p300', volume=circ_vol, rate=mix_rate, well=well,
+                                target=target))
+            b.steps.append(Step(b.block, 'delay', seconds=s['lap_delay']))
+
+    b.drop_tip('p300')
+
+
+
+### BLOCK 4 ###
+# the premise here is that we grab a 10 uL tip, pick up some protein, pick up
+# an equal amount of reserviour, and dispense the total mixture into the growth
+# well in the center. A batch of plates gets its drops one plate at a time.
+
+def drop_block(b):
+    if b.settings['xtal_well_depth'] is None:
+        raise LabwareError(f"{b.deck['labware'][PLATE][0]} has no drop well, its plans only fill the "
+                           f"reservoirs; leave 'protein' out")
+
+    b.block  = 4
+    s        = b.settings
+    reagent  = b.spec['protein']
+    half_vol = s['growth_well_half_vol']
+    rate     = b.rate(reagent, 'dispense', 'drop_rate')
+
+    for plate, well in b.plate_wells():
+        places = b.place(well)
+        b.pick_up_tip('p10')
+        b.draw('p10', reagent, half_vol, well)
+
+        b.emit('move_to', 'p10', target=places.above, well=well)
+        b.emit('move_to', 'p10', target=places.dip, well=well)
+        b.emit('aspirate', 'p10', volume=half_vol, well=well, rate=b.rate(None, 'aspirate'), target=places.reservoir)
+        b.emit('move_to', 'p10', target=places.above, well=well)
+
+        # dispense resivour + protein into growth well + a little extra to encourage
+        # all of the liquid to leave the tip at smoothly as possible
+        b.emit('dispense', 'p10', volume=s['drop_factor'] * half_vol, rate=rate, well=well, target=places.drop)
+
+        # do a small tip touch to encourage the small volume to remain in the pedestal
+        b.emit('touch_tip', 'p10', radius=0.125, well=well, target=places.touch)
+        b.drop_tip('p10')
+
+
+
+# the aspirate depth of every source draw in steps, for the order the steps
+# are in (so plans can be reordered after planning). One batch per source
+# tube, none below the bottom of the deck's well it stands in
+
+def draw_depths(steps, sources, deck):
+    steps      = list(steps)
+    left       = {name: src['volume'] * 1000 for name, src in sources.items()}
+    per_source = {}
+
+    for index, step in enumerate(steps):
+        if step.kind == 'aspirate' and step.reagent in sources:
+            left[step.reagent] = left[step.reagent] - step.volume * (step.channels or 1)
+            per_source.setdefault(step.reagent, []).append((index, left[step.reagent]))
+
+    for reagent, draws in per_source.items():
+        source = sources[reagent]
+        depth  = well_geometry(deck['labware'][source['labware']][0], source['well'])[3]
+        depths = vial_depths(source['vial'], [uL for _, uL in draws], depth)
+
+        for (index, _), (ref, z) in zip(draws, depths):
+            steps[index] = steps[index]._replace(target=steps[index].target._replace(ref=ref, z=z))
+
+    return steps
+
+
+
+# walk every block in order and return the full list of Steps for the plate
+
+def plan_plate(spec):
+    b = PlanBuilder(spec)
+
+    reservoir_block(b)
+    if spec.get('water'):
+        water_block(b)
+    if b.mix == 'pass':
+        mix_block(b)
+    if spec.get('protein'):
+        drop_block(b)
+
+    return draw_depths(b.steps, b.sources, b.deck)
+
+
+
+def resolve(labware, target):
+    well = labware[target.labware][target.well]
+
+    if target.ref == 'bottom':
+        return well.bottom(target.z)
+
+    if target.ref == 'top':
+        loc = well.top(z=target.z)
+        if target.x or target.y:
+            loc = loc.move(types.Point(x=target.x, y=target.y))
+        return loc
+
+    return well.center().move(types.Point(x=target.x, y=target.y, z=target.z))
+
+
+
+# {Target: Location} on the loaded labware, each resolved the first time a
+# step goes there. A plate is a few dozen points visited over and over
+
+class Locations(dict):
+
+    def __init__(self, labware):
+        super().__init__()
+        self.labware = labware
+
+
+    def __missing__(self, target):
+        location     = resolve(self.labware, target)
+        self[target] = location
+        return location
+
+
+
+# one Step on the robot
+
+def run_step(protocol, locations, pips, step):
+    if step.kind == 'delay':
+        protocol.delay(seconds=step.seconds)
+        return
+
+    pip = pips[step.pipette]
+
+    if step.kind == 'pick_up_tip':
+        pip.pick_up_tip()
+    elif step.kind == 'drop_tip':
+        pip.drop_tip()
+    elif step.kind == 'aspirate':
+        pip.aspirate(step.volume, locations[step.target], rate=step.rate or 1.0)
+    elif step.kind == 'air_gap':
+        pip.air_gap(step.volume)
+    elif step.kind == 'dispense':
+        pip.dispense(step.volume, locations[step.target], rate=step.rate)
+    elif step.kind == 'move_to':
+        pip.move_to(locations[step.target])
+    elif step.kind == 'touch_tip':
+        well = locations.labware[step.target.labware][step.target.well]
+        pip.touch_tip(well, v_offset=step.target.z, radius=step.radius)
+    else:
+        raise ValueError(f'unknown step kind {step.kind!r}')
+
+
+
+# load the deck and arms, then hand every Step to the robot. Extra tip racks
+# go into free slots if the plan needs more tips than the deck holds.
+#   logs:       every step is timed on clock and handed to log.step(index,
+#               step, seconds) (crystal_engine.telemetry, .checkpoint)
+#   start_tips: {pipette: tips already used}, for a resumed plate
+
+def execute(protocol, steps, deck=None, logs=(), clock=time.monotonic, start_tips=None):
+    deck    = with_tip_racks(deck or DEFAULT_DECK, steps)
+    labware = {name: load_labware(protocol, load_name, slot)
+               for name, (load_name, slot) in deck['labware'].items()}
+    pips    = {name: protocol.load_instrument(model, mount, tip_racks=[labware[r] for r in racks])
+               for name, (model, mount, racks) in deck['pipettes'].items()}
+
+    for name, used in (start_tips or {}).items():
+        if used:
+            tips = [well for rack in deck['pipettes'][name][2] for well in labware[rack].wells()]
+            pips[name].starting_tip = tips[used]
+
+    locations = Locations(labware)
+
+    for index, step in enumerate(steps):
+        if not logs:
+            run_step(protocol, locations, pips, step)
+            continue
+
+        start   = clock()
+        run_step(protocol, locations, pips, step)
+        seconds = clock() - start
+        for log in logs:
+            log.step(index, step, seconds)
+
+    return labware, pips
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Run-time estimator: dry-run a plate on the FakeProtocolContext and report
+how long it will take, per BLOCK and per reagent.
+
+    python -m crystal_engine estimate OT2_HEWL_PC.py CJ_single_tip_V5.py
+
+Works offline; the opentrons package is not needed.
+"""
+
+import importlib.util
+import os
+import sys
+
+from .engine import execute, mix_mode
+from .runner import plan_run
+from .simulate import FakeProtocolContext, install
+
+
+BLOCK_NAMES = {
+    1: 'BLOCK 1 reservoir',
+    2: 'BLOCK 2 water',
+    3: 'BLOCK 3 mix',
+    4: 'BLOCK 4 drops',
+}
+
+# which column of the block table each command kind counts toward. The gantry
+# travel to a command's location (Command.travel) always counts as 'moving'
+CATEGORIES = {
+    'pick_up_tip': 'tips',
+    'drop_tip':    'tips',
+    'aspirate':    'liquid',
+    'dispense':    'liquid',
+    'touch_tip':   'liquid',
+    'blow_out':    'liquid',
+    'air_gap':     'liquid',
+    'move_to':     'moving',
+    'delay':       'delay',
+}
+
+
+
+# import a protocol script by path, with the fake opentrons modules in place
+# if the real package is missing
+
+def load_protocol(path):
+    install()
+    name   = os.path.splitext(os.path.basename(path))[0]
+    spec   = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+
+    # the scripts import crystal_engine from the folder they live in
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+
+    return module
+
+
+
+# call a script's own run() on a FakeProtocolContext, exactly as the robot
+# would, and hand back the context with every command recorded
+
+def run_protocol(path):
+    module   = load_protocol(path)
+    protocol = FakeProtocolContext()
+    module.run(protocol)
+    return protocol
+
+
+
+# execute the plan on a FakeProtocolContext. Every Step turns into exactly one
+# recorded command, so the two lists line up
+
+def simulate(spec, steps=None):
+    steps    = plan_run(spec) if steps is None else steps
+    protocol = FakeProtocolContext()
+    execute(protocol, steps, spec.get('deck'))
+    return list(zip(steps, protocol.commands))
+
+
+
+# which reagent every step works for. Tips, moves and delays count toward the
+# reagent handled right before them, or right after them at the start of a block
+
+def reagent_labels(steps):
+    labels = [None] * len(steps)
+    label  = None
+
+    for i, step in enumerate(steps):
+        if i and step.block != steps[i - 1].block:
+            label = None
+        label     = step.reagent or label
+        labels[i] = label
+
+    for i in range(len(steps) - 2, -1, -1):
+        if labels[i] is None and steps[i].block == steps[i + 1].block:
+            labels[i] = labels[i + 1]
+
+    return [label or 'reservoir' for label in labels]
+
+
+
+def summarize(timed):
+    blocks   = {}
+    reagents = {}
+    labels   = reagent_labels([step for step, _ in timed])
+
+    for (step, command), label in zip(timed, labels):
+        category        = CATEGORIES[command.kind]
+        row             = blocks.setdefault(step.block, dict.fromkeys(['moving', 'liquid', 'tips', 'delay', 'total'], 0.0))
+        row['moving']   = row['moving'] + command.travel
+        row[category]   = row[category] + command.seconds - command.travel
+        row['total']    = row['total'] + command.seconds
+        reagents[label] = reagents.get(label, 0.0) + command.seconds
+
+    return {
+        'total':    sum(row['total'] for row in blocks.values()),
+        'blocks':   blocks,
+        'reagents': reagents,
+    }
+
+
+
+def _minutes(seconds):
+    return f'{int(seconds // 60):>3d}:{seconds % 60:04.1f}'
+
+
+
+def report(spec, name='plate'):
+    summary = summarize(simulate(spec))
+
+    print(f'== {name}: {_minutes(summary["total"]).strip()} (min:sec) ==')
+    print(f'{"":<20} {"moving":>9} {"liquid":>9} {"tips":>9} {"delay":>9} {"total":>9}')
+    for block, row in sorted(summary['blocks'].items()):
+        print(f'{BLOCK_NAMES.get(block, block):<20}' + ''.join(
+              f' {_minutes(row[k]):>9}' for k in ('moving', 'liquid', 'tips', 'delay', 'total')))
+
+    print()
+    for reagent, seconds in sorted(summary['reagents'].items(), key=lambda kv: -kv[1]):
+        print(f'{reagent:<20} {_minutes(seconds):>9}')
+
+    # what the delay policy (and the liquid classes' rates) buy over the old
+    # fixed delay after every step and one set of rates
+    if spec.get('delays') or spec.get('liquids'):
+        label = 'liquid classes save' if spec.get('liquids') else 'delay policy saves'
+        fixed = summarize(simulate(dict(spec, delays=None, liquids=None)))
+        saved = fixed['total'] - summary['total']
+        print(f'\n{label} {_minutes(saved).strip()} against a fixed '
+              f'{spec.get("settings", {}).get("delay", 0.25)} s delay after every step')
+
+    # and what interleaving the drops buys over doing them after every other block
+    if spec.get('interleave'):
+        serial = summarize(simulate(dict(spec, interleave=False)))
+        saved  = serial['total'] - summary['total']
+        print(f'interleaved drops save {_minutes(saved).strip()} against the block-serial order')
+
+    # and what the peephole pass buys over every move_to the planner wrote
+    if spec.get('compact'):
+        loose = summarize(simulate(dict(spec, compact=False)))
+        saved = loose['total'] - summary['total']
+        print(f'compacted moves save {_minutes(saved).strip()} against the planned move_to climbs')
+
+    # and what mixing during the last dispense would buy over the BLOCK 3 pass
+    if mix_mode(spec) == 'pass':
+        ringed = summarize(simulate(dict(spec, mix='last')))
+        saved  = summary['total'] - ringed['total']
+        print(f"mixing during the last dispense ('mix': 'last') would save {_minutes(saved).strip()} "
+              f"against the BLOCK 3 pass")
+
+    print()
+    return summary
+
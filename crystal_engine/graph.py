@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+The plate setup as an explicit task graph.
+
+Tasks are 'add' (one reagent into one well), 'mix' (BLOCK 3 in one well) and
+'drop' (the protein drop in one well). Edges say what has to happen first:
+
+    order   reservoir reagents in the spec's order, then water (salt before water)
+    tip     a clean tip reagent goes in before anything that would spoil its tip
+    mix     every component of a well before it is mixed (with 'mix': 'last'
+            the mixing is part of the last add and there are no mix tasks)
+    drop    the finished reservoir (mixed or not) before the drop
+
+The planner's blocks are one way through the graph. Anything that reorders a
+plan is held to it: the scheduler drops well orders that break an edge,
+interleave only moves a drop past its own well's predecessors, and
+runner.plan_run refuses any compiled plan (interleaved, compacted, a batch
+of plates) with violations. Graphs are plain JSON, so plans can be diffed
+and cached between runs:
+
+    python -m crystal_engine graph OT2_HEWL_PC.py > hewl.json
+"""
+
+import json
+from collections import namedtuple
+
+from .deck import multichannel_columns
+from .engine import DEFAULT_DECK, mix_mode, plates
+
+
+Task = namedtuple('Task', ['id', 'kind', 'plate', 'well', 'reagent', 'volume'],
+                  defaults=[None, None])
+
+EDGE_KINDS = ('order', 'tip', 'mix', 'drop')
+
+
+
+def task_id(kind, plate, well, reagent=None):
+    return '/'.join(p for p in (kind, reagent, plate, well) if p is not None)
+
+
+
+class TaskGraph:
+
+    def __init__(self, tasks=(), edges=()):
+        self.tasks = {task.id: task for task in tasks}
+        self.edges = list(edges)           # (before, after, kind)
+
+
+    def predecessors(self, task):
+        return [a for a, b, _ in self.edges if b == task]
+
+
+    def to_dict(self):
+        return {
+            'tasks': [task._asdict() for task in self.tasks.values()],
+            'edges': [list(edge) for edge in self.edges],
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([Task(**task) for task in data['tasks']], [tuple(e) for e in data['edges']])
+
+
+    # stable text: the same plate always gives the same JSON
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), sort_keys=True, **kwargs)
+
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+
+# the task graph of a plate spec (every plate of a batch)
+
+def task_graph(spec):
+    reservoir = list(spec['reservoir'])
+    water     = (spec.get('water') or {}).get('reagent')
+    order     = reservoir + ([water] if water and water not in reservoir else [])
+    clean     = set(spec.get('clean_tips', []))
+    tasks     = []
+    edges     = []
+
+    for plate, p in plates(spec).items():
+        well_information = p['well_information']
+
+        for well in p['wells']:
+            added = [r for r in order if well_information[well].get(r, 0) > 0]
+            ids   = [task_id('add', plate, well, r) for r in added]
+            tasks.extend(Task(i, 'add', plate, well, r, well_information[well][r]) for i, r in zip(ids, added))
+
+            edges.extend((a, b, 'order') for a, b in zip(ids, ids[1:]))
+            edges.extend((ids[i], ids[j], 'tip') for i, r in enumerate(added) if r in clean
+                         for j in range(i + 1, len(added)))
+
+            finished = ids
+            if mix_mode(spec) == 'pass':
+                mix = task_id('mix', plate, well)
+                tasks.append(Task(mix, 'mix', plate, well))
+                edges.extend((a, mix, 'mix') for a in ids)
+                finished = [mix]
+
+            if spec.get('protein'):
+                drop = task_id('drop', plate, well)
+                tasks.append(Task(drop, 'drop', plate, well, spec['protein'],
+                                  spec.get('settings', {}).get('growth_well_half_vol')))
+                edges.extend((a, drop, 'drop') for a in finished)
+
+    return TaskGraph(tasks, edges)
+
+
+
+# plate wells a dispense lands in; an 8-channel dispense fills its whole column
+
+def landed(step, deck):
+    t = step.target
+    if (step.channels or 1) > 1:
+        return [(t.labware, w) for w in multichannel_columns(deck['labware'][t.labware][0])[t.well]]
+    return [(t.labware, t.well)]
+
+
+
+# {task id: index of the step that finishes it} for a plan. An add is done
+# with the last dispense of its reagent into the well, a mix with its last
+# lap and a drop with the drop dispense
+
+def done_at(spec, steps):
+    deck      = spec.get('deck') or DEFAULT_DECK
+    on_plates = set(plates(spec))
+    done      = {}
+
+    for i, step in enumerate(steps):
+        if step.kind != 'dispense' or step.target is None or step.target.labware not in on_plates:
+            continue
+
+        for plate, well in landed(step, deck):
+            if step.block == 3:
+                done[task_id('mix', plate, well)] = i
+            elif step.block == 4:
+                done[task_id('drop', plate, well)] = i
+            else:
+                done[task_id('add', plate, well, step.reagent)] = i
+
+    return done
+
+
+
+# edges a plan breaks, as (before, after, kind). An empty list means the
+# plan does everything in an order the graph allows
+
+def violations(graph, spec, steps):
+    done = done_at(spec, steps)
+    return [(a, b, kind) for a, b, kind in graph.edges
+            if a in done and b in done and done[a] > done[b]]
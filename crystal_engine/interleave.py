@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Interleaved drops: set a well's protein drop as soon as that well's
+reservoir is finished instead of after the whole plate.
+
+The OT-2 moves one mount at a time, so nothing really runs in parallel; what
+interleaving buys is gantry travel. A drop (p10 tip, protein, well, trash)
+slotted in where the gantry passes by anyway replaces the long trash -> tip
+rack leg it costs in the drop block. Each drop only depends on its own well:
+it goes in after the last BLOCK 1-3 step that touches the well, never while
+the p10 holds a tip of its own, never while any tip holds liquid on its way
+to a well (more than its reverse pipetting cushion) and never between a step
+and its settle delay. A drop stays in the drop block when no slot is cheaper. What a drop
+waits for comes from the task graph (crystal_engine.graph).
+
+    spec['interleave'] = True
+"""
+
+from .deck import leg_mm
+from .engine import DEFAULT_DECK, draw_depths
+from .graph import done_at, landed, task_graph, task_id
+from .scheduler import step_positions
+from .tips import with_tip_racks
+
+
+DROP_BLOCK = 4
+DROP_PIP   = 'p10'
+
+
+
+# the drop block cut into one unit per drop: pick_up_tip .. drop_tip and the
+# delays that follow it
+
+def drop_units(steps):
+    units = []
+    for step in steps:
+        if step.kind == 'pick_up_tip' or not units:
+            units.append([])
+        units[-1].append(step)
+    return units
+
+
+
+# where the gantry is after every step, as (labware, xyz). Delays and other
+# steps that go nowhere leave it where it was
+
+def gantry_positions(steps, deck):
+    placed = {id(step): (lw, xyz) for step, lw, xyz in step_positions(steps, deck)}
+    here   = None
+    out    = []
+
+    for step in steps:
+        here = placed.get(id(step), here)
+        out.append(here)
+
+    return out
+
+
+
+# what a tip holds over its cushion after step: a draw for a well (or the
+# mix draw from one) and air gaps come in, dispenses go out. The cushion draw
+# (no well) stays in the tip until it is dropped
+
+def holding(uL, step):
+    if step.kind in ('pick_up_tip', 'drop_tip'):
+        return 0
+    if step.kind == 'air_gap' or step.kind == 'aspirate' and step.well is not None:
+        return uL + step.volume
+    if step.kind == 'dispense':
+        return round(max(uL - step.volume, 0), 6)
+    return uL
+
+
+
+def interleave(spec, steps):
+    deck  = with_tip_racks(spec.get('deck') or DEFAULT_DECK, steps)
+    graph = task_graph(spec)
+    first = next((i for i, s in enumerate(steps) if s.block == DROP_BLOCK), len(steps))
+    base  = steps[:first]
+    units = drop_units(steps[first:])
+
+    if not units:
+        return steps
+
+    # the step that finishes every task a drop could be waiting for
+    ready = done_at(spec, base)
+
+    # boundaries a drop may go in front of: the p10 is free there, no tip
+    # holds anything but its cushion and the step is not the settle delay of
+    # the one before it
+    p10_busy = False
+    held     = {}                                       # pip -> uL over its cushion
+    open_at  = []
+    for i, step in enumerate(base):
+        if i and step.kind != 'delay' and not p10_busy and not any(held.values()):
+            open_at.append(i)
+        if step.pipette == DROP_PIP and step.kind in ('pick_up_tip', 'drop_tip'):
+            p10_busy = step.kind == 'pick_up_tip'
+        held[step.pipette] = holding(held.get(step.pipette, 0), step)
+    if not p10_busy and not any(held.values()):
+        open_at.append(len(base))
+
+    where    = gantry_positions(steps, deck)
+    start    = {}                                       # unit -> (labware, xyz) first / last
+    for n, unit in enumerate(units):
+        offset   = first + sum(len(u) for u in units[:n])
+        located  = [p for p in where[offset:offset + len(unit)] if p is not None]
+        start[n] = (located[0], located[-1])
+
+    def leg(a, b):
+        if a is None or b is None:
+            return 0.0
+        return leg_mm(a[1], b[1], a[0] == b[0])
+
+    after    = {i: where[i - 1] for i in open_at}      # gantry before the boundary
+    before   = {}                                       # next position from the boundary on
+    nxt      = None
+    for i in range(len(base), 0, -1):
+        if i < len(base) and where[i] is not None:
+            nxt = where[i]
+        before[i] = nxt
+
+    inserted = {}
+    tail     = []
+    last     = where[first - 1] if first else None
+
+    for n, unit in enumerate(units):
+        drops       = [task_id('drop', *k) for step in unit if step.kind == 'dispense'
+                       for k in landed(step, deck)]
+        due         = max((ready.get(t, -1) for d in drops for t in graph.predecessors(d)), default=-1)
+        head, end   = start[n]
+
+        stay        = leg(last, head)
+        best, cost  = None, stay
+
+        for i in open_at:
+            if i <= due:
+                continue
+            prev  = after[i] if not inserted.get(i) else start[inserted[i][-1]][1]
+            extra = leg(prev, head) + leg(end, before[i]) - leg(prev, before[i])
+            if extra < cost - 1e-9:
+                best, cost = i, extra
+
+        if best is None:
+            tail.append(n)
+            last = end
+        else:
+            inserted.setdefault(best, []).append(n)
+
+    out = []
+    for i, step in enumerate(base):
+        for n in inserted.get(i, []):
+            out.extend(units[n])
+        out.append(step)
+    for n in inserted.get(len(base), []) + tail:
+        out.extend(units[n])
+
+    # protein is drawn in a new order, so its depths change
+    return draw_depths(out, spec['sources'], spec.get('deck') or DEFAULT_DECK)
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Custom labware: validated definitions, drop plate sub-wells and loading.
+
+The JSON definitions ship inside the package, in crystal_engine/definitions
+(hamptonresearch_24_wellplate_24x500ul_JD.json, ...): every JSON there is a
+definition. Next to the protocols or in the working directory only the files
+the decks name (DEFINITION_FILES, ADAPTERS) are looked for, the package's own
+copy first (SEARCH_DIRS); a file that is not readable JSON is logged and
+skipped. They are parsed and checked once (validate) and kept for the rest
+of the run. The parsed definitions, and what was
+measured from the plate adapter's STL, also go into the plan cache
+(crystal_engine.cache) under the files' names, sizes and times, so loading
+a protocol again reads one file instead of parsing and checking everything.
+
+A Cryschem well is two wells in one: the reservoir, a ring around the drop
+post, and the sitting drop cup on top of the post. The definition only has
+the reservoir, so the planner needs 'offset' (where in the ring to go) and
+'xtal_well_depth' (the drop cup) on top of it. Those are the values the
+scripts were calibrated with on the robot, kept per plate in
+PLATE_SETTINGS; a spec's settings still win:
+
+    plate_settings('hamptonresearch_24_wellplate_24x500ul_jd')
+    # {'offset': 5.5, 'xtal_well_depth': -1.5}
+
+A plate without calibrated values gets them from its definition: the tip
+goes down the middle of the well, low enough to dispense under the liquid
+and high enough that the mix draw stays clear of the bottom. Such a plate
+has no drop cup, so its plans only fill the reservoirs:
+
+    plate_settings('sittingdrop_96_wellplate_96x100ul_jd')
+    # {'offset': 0, 'depth': -0.5, 'xtal_well_depth': None}
+
+check_targets() holds every planned point of a plate inside its well.
+
+load_labware() hands a custom definition to the robot itself, so the plate
+does not have to be added to the app first.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+from math import hypot
+
+from .cache import engine_digest, load, store
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# every JSON in here is a labware definition
+DEFINITIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'definitions')
+
+# where the files of DEFINITION_FILES and ADAPTERS are looked for, first one wins
+SEARCH_DIRS = [DEFINITIONS_DIR, ROOT, os.getcwd()]
+
+# the file every custom labware the decks use comes in
+DEFINITION_FILES = {
+    'hamptonresearch_24_wellplate_24x500ul_jd': 'hamptonresearch_24_wellplate_24x500ul_JD.json',
+    'sittingdrop_96_wellplate_96x100ul_jd':     'sittingdrop_96_wellplate_96x100ul_JD.json',
+}
+
+
+# the old calibrated values, mm, set by hand on the robot for the Cryschem
+# plate: offset is how far from the middle of a well the reservoir is
+# reached (the post is in the middle), xtal_well_depth how far from the
+# middle of the well (top(-depth / 2)) the drop cup is. Neither is in the
+# definition and neither is measured from anything
+PLATE_SETTINGS = {
+    'hamptonresearch_24_wellplate_24x500ul_jd': {'offset': 5.5, 'xtal_well_depth': -1.5},
+}
+
+# the Cryschem definition only has the part of the well over the post (4.4
+# mm from z 22); the reservoir runs further down than that, so for these
+# plates a point is only held above the bottom of the plate
+PARTIAL_WELLS = {'hamptonresearch_24_wellplate_24x500ul_jd'}
+
+# mm, the mix draw goes this far under the dispense depth (see
+# crystal_engine.engine.well_places)
+MIX_DIP = 2.5
+
+# mm, the closest a tip gets to the bottom of a plate well
+WELL_CLEARANCE = 1
+
+# the STL of the tray a plate sits in, checked against the plate's footprint
+# (see measure_adapter); it has no post or cup, so nothing else comes from it
+ADAPTERS = {
+    'hamptonresearch_24_wellplate_24x500ul_jd': 'Cryschem_Plate_Adapter_V1.stl',
+}
+
+# how far (mm) the adapter may be off the plate's footprint
+ADAPTER_TOLERANCE = 0.5
+
+
+_loaded = None
+
+log = logging.getLogger(__name__)
+
+
+
+class LabwareError(ValueError):
+    pass
+
+
+
+# everything a definition needs for planning and loading, and wells that fit
+# inside the labware
+
+def validate(definition, name='labware'):
+    for key in ('parameters', 'wells', 'ordering', 'dimensions', 'cornerOffsetFromSlot'):
+        if key not in definition:
+            raise LabwareError(f'{name}: no {key!r}')
+    if 'loadName' not in definition['parameters']:
+        raise LabwareError(f'{name}: no loadName')
+
+    dims    = definition['dimensions']
+    wells   = definition['wells']
+    ordered = [w for column in definition['ordering'] for w in column]
+
+    if sorted(ordered) != sorted(wells):
+        raise LabwareError(f'{name}: ordering and wells list different wells')
+
+    for well, w in wells.items():
+        if w['depth'] <= 0:
+            raise LabwareError(f'{name} {well}: depth {w["depth"]}')
+        if w['shape'] == 'circular':
+            half_x = half_y = w['diameter'] / 2
+        else:
+            half_x, half_y = w['xDimension'] / 2, w['yDimension'] / 2
+        if not (half_x <= w['x'] <= dims['xDimension'] - half_x and half_y <= w['y'] <= dims['yDimension'] - half_y):
+            raise LabwareError(f'{name} {well}: ({w["x"]}, {w["y"]}) is outside the labware')
+        if w['z'] < 0 or w['z'] + w['depth'] > dims['zDimension'] + 0.01:
+            raise LabwareError(f'{name} {well}: goes from {w["z"]} to {w["z"] + w["depth"]} mm, '
+                               f'the labware is {dims["zDimension"]} mm high')
+
+    return definition
+
+
+
+# the triangles of a binary STL as (normal, a, b, c)
+
+def read_stl(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < 84:
+        raise LabwareError(f'{path}: not a binary STL')
+    count = struct.unpack_from('<I', data, 80)[0]
+    if len(data) < 84 + 50 * count:
+        raise LabwareError(f'{path}: not a binary STL')
+
+    triangles = []
+    for i in range(count):
+        v = struct.unpack_from('<12f', data, 84 + 50 * i)
+        triangles.append((v[0:3], v[3:6], v[6:9], v[9:12]))
+    return triangles
+
+
+
+# what the plate adapter looks like, mm: its footprint, the height of the
+# base the plate's skirt stands on and the top of the platform inside it
+
+def measure_adapter(path):
+    triangles = read_stl(path)
+    points    = [p for t in triangles for p in t[1:]]
+    xs, ys    = [p[0] for p in points], [p[1] for p in points]
+    footprint = (max(xs) - min(xs), max(ys) - min(ys))
+
+    # flat faces looking up, by height, and how far out they reach
+    flats = {}
+    for normal, *corners in triangles:
+        if normal[2] > 0.99:
+            z        = round(corners[0][2], 3)
+            flats[z] = max(flats.get(z, 0), max(abs(c[0]) for c in corners))
+
+    seat = max((z for z, reach in flats.items() if reach >= footprint[0] / 2 - ADAPTER_TOLERANCE and z > 0),
+               default=0.0)
+
+    return {
+        'footprint': [round(d, 2) for d in footprint],
+        'seat':      seat,
+        'height':    round(max(p[2] for p in points), 3),
+    }
+
+
+
+# the adapter has to take the plate (either way round)
+
+def check_adapter(name, definition, adapter):
+    dims      = definition['dimensions']
+    plate     = sorted([dims['xDimension'], dims['yDimension']])
+    footprint = sorted(adapter['footprint'])
+
+    if any(abs(a - b) > ADAPTER_TOLERANCE for a, b in zip(plate, footprint)):
+        raise LabwareError(f'{name}: the adapter is {footprint[0]} x {footprint[1]} mm, '
+                           f'the plate {plate[0]} x {plate[1]} mm')
+
+
+
+def _parse(paths):
+    definitions = {}
+    adapters    = {}
+
+    for path in paths:
+        if not path.endswith('.json'):
+            continue
+        try:
+            with open(path) as f:
+                definition = json.load(f)
+        except (OSError, ValueError) as error:
+            log.warning('%s is not a readable labware definition, skipped: %s', path, error)
+            continue
+        if isinstance(definition, dict) and 'parameters' in definition and 'wells' in definition:
+            validate(definition, os.path.basename(path))
+            definitions[definition['parameters']['loadName']] = definition
+
+    for load_name, file_name in ADAPTERS.items():
+        if load_name not in definitions:
+            continue
+        path = find_file(file_name)
+        if path is not None:
+            adapters[file_name] = measure_adapter(path)
+            check_adapter(load_name, definitions[load_name], adapters[file_name])
+
+    return {'definitions': definitions, 'adapters': adapters}
+
+
+
+# the definitions and adapter measurements, parsed once per run and cached
+# on disk until a file or the engine changes
+
+def _load():
+    global _loaded
+
+    if _loaded is None:
+        paths = labware_files()
+        stamp = [(os.path.basename(p), os.path.getsize(p), os.path.getmtime(p)) for p in paths]
+        key   = 'labware-' + hashlib.sha256((engine_digest() + json.dumps(stamp)).encode()).hexdigest()
+
+        _loaded = load(key)
+        if _loaded is None:
+            _loaded = _parse(paths)
+            store(key, _loaded)
+
+        for load_name, file_name in ADAPTERS.items():
+            if load_name in _loaded['definitions'] and file_name not in _loaded['adapters']:
+                log.warning('%s not found, the adapter for %s is not checked', file_name, load_name)
+
+    return _loaded
+
+
+
+# the definitions and adapter STLs to load: all of DEFINITIONS_DIR and the
+# named files found in SEARCH_DIRS, one per file name (the first found)
+
+def labware_files():
+    found = {os.path.basename(p): p for p in sorted(glob.glob(os.path.join(DEFINITIONS_DIR, '*.json')))}
+    for name in [*DEFINITION_FILES.values(), *ADAPTERS.values()]:
+        path = find_file(name)
+        if path is not None:
+            found.setdefault(name, path)
+    return list(found.values())
+
+
+
+# files matching pattern in SEARCH_DIRS, one per file name (the first found)
+
+def search(pattern):
+    found = {}
+    for directory in dict.fromkeys(SEARCH_DIRS):
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            found.setdefault(os.path.basename(path), path)
+    return list(found.values())
+
+
+
+def find_file(name):
+    return next(iter(search(name)), None)
+
+
+
+# every custom labware definition in the repo, keyed by its load name
+
+def custom_definitions():
+    return _load()['definitions']
+
+
+
+# a labware the planner knows neither from a definition nor from the stock
+# table; names the file it should come in
+
+def missing(load_name):
+    if load_name in DEFINITION_FILES:
+        return LabwareError(f'no labware definition for {load_name!r}: put {DEFINITION_FILES[load_name]} into '
+                            f'crystal_engine/definitions (or next to the protocol)')
+    return LabwareError(f'no labware definition for {load_name!r}: put {load_name}.json into '
+                        f'crystal_engine/definitions')
+
+
+
+def adapter(file_name):
+    return _load()['adapters'].get(file_name)
+
+
+
+# the planner settings that belong to a plate rather than to a protocol: the
+# calibrated ones, else worked out from the definition. Nothing for a plate
+# without a definition
+
+def plate_settings(load_name):
+    if load_name in PLATE_SETTINGS:
+        return dict(PLATE_SETTINGS[load_name])
+
+    definition = custom_definitions().get(load_name)
+    if definition is None:
+        return {}
+
+    first = definition['ordering'][0][0]
+    w     = definition['wells'][first]
+
+    return {
+        'offset':          0,
+        'depth':           round(-w['depth'] / 2 + MIX_DIP + WELL_CLEARANCE, 3),
+        'xtal_well_depth': None,
+    }
+
+
+
+# raise on a Target ('top', 'center' or 'bottom' of a plate well plus x, y, z)
+# that is off the well's opening or under its bottom. Over the top is fine,
+# that is how the tip gets there
+
+def check_targets(load_name, targets):
+    definition = custom_definitions().get(load_name)
+    if definition is None:
+        return
+
+    for t in targets:
+        w     = definition['wells'][t.well]
+        z     = t.z + {'top': 0, 'center': -w['depth'] / 2, 'bottom': -w['depth']}[t.ref]
+        floor = -(w['z'] + w['depth']) if load_name in PARTIAL_WELLS else -w['depth']
+
+        if w['shape'] == 'circular':
+            fits = hypot(t.x, t.y) <= w['diameter'] / 2
+        else:
+            fits = abs(t.x) <= w['xDimension'] / 2 and abs(t.y) <= w['yDimension'] / 2
+
+        if not fits or z < floor:
+            raise LabwareError(f'{load_name} {t.well}: {t.ref} + ({t.x:g}, {t.y:g}, {t.z:g}) mm '
+                               f'is outside the well')
+
+
+
+# a labware on the robot. Custom labware goes in from its definition
+def load_labware(protocol, load_name, slot):
+    definition = custom_definitions().get(load_name)
+    if definition is not None:
+        return protocol.load_labware_from_definition(definition, slot)
+    return protocol.load_labware(load_name, slot)
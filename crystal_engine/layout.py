@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Deck layout optimizer: which slot every labware should go in.
+
+The slots in the decks are the ones the scripts always used, but every trip
+of BLOCK 1/2/4 crosses from a source to the plate (and the drops go protein
+-> reservoir -> drop for every well), so where things sit drives the run
+time. optimize_layout() takes a compiled plan and searches slot assignments
+for the least gantry travel: it keeps moving one labware to a free slot, or
+swapping two, while that shortens the plan, with the labware footprints
+(the Hampton plate covers two slots) and the trash in slot 12 respected.
+BLOCK 4 goes protein -> reservoir -> drop for every well, so the protein
+rack only goes to slots beside a plate. The report shows the recommended
+deck and the time it saves on the fake context:
+
+    python -m crystal_engine layout OT2_HEWL_PC.py
+
+Well orders are scheduled for the deck they run on, so schedule again
+(schedule_plates) after moving labware.
+"""
+
+from itertools import combinations
+
+from .deck import footprint
+from .engine import DEFAULT_DECK, plates
+from .estimate import _minutes, simulate
+from .runner import plan_run
+from .scheduler import travel_mm
+from .tips import with_tip_racks
+
+
+
+# slots are 3 to a row, 1-3 at the front
+def touching(a, b):
+    return any(abs((s - 1) // 3 - (t - 1) // 3) + abs((s - 1) % 3 - (t - 1) % 3) == 1
+               for s in a for t in b)
+
+
+
+# does every labware sit on the deck without overlapping another or the trash,
+# with every labware of beside ({labware: [labware]}) next to one of its list
+def valid(labware, beside=None):
+    used = []
+    for load_name, slot in labware.values():
+        used.extend(footprint(load_name, slot))
+    if len(used) != len(set(used)) or not all(1 <= slot <= 11 for slot in used):
+        return False
+
+    for name, others in (beside or {}).items():
+        if name in labware and not any(touching(footprint(*labware[name]), footprint(*labware[o]))
+                                       for o in others if o in labware):
+            return False
+    return True
+
+
+
+# every deck one move away: a labware into an empty slot, or two swapped
+def neighbours(deck, beside=None):
+    labware = deck['labware']
+    taken   = {slot for _, slot in labware.values()}
+
+    for name, (load_name, slot) in labware.items():
+        for other in range(1, 12):
+            if other not in taken:
+                moved = dict(labware, **{name: (load_name, other)})
+                if valid(moved, beside):
+                    yield dict(deck, labware=moved)
+
+    for a, b in combinations(labware, 2):
+        swapped = dict(labware, **{a: (labware[a][0], labware[b][1]), b: (labware[b][0], labware[a][1])})
+        if valid(swapped, beside):
+            yield dict(deck, labware=swapped)
+
+
+
+# the deck (tip racks the plan needs included) with the least travel for
+# steps, and that travel in mm. Best improvement first until nothing helps.
+# A deck that breaks beside starts the search anyway and is left as soon as
+# a move fixes it
+def optimize_layout(steps, deck=None, beside=None):
+    deck = with_tip_racks(deck or DEFAULT_DECK, steps)
+    best = travel_mm(steps, deck) if valid(deck['labware'], beside) else float('inf')
+
+    while True:
+        candidate, mm = min(((d, travel_mm(steps, d)) for d in neighbours(deck, beside)),
+                            key=lambda c: c[1], default=(None, best))
+        if mm >= best - 1e-6:
+            return deck, best
+        deck, best = candidate, mm
+
+
+
+def layout_report(spec, name='plate'):
+    steps        = plan_run(spec)
+    before       = with_tip_racks(spec.get('deck') or DEFAULT_DECK, steps)
+    beside       = {}
+    if spec.get('protein'):
+        beside[spec['sources'][spec['protein']]['labware']] = list(plates(spec))
+    after, mm    = optimize_layout(steps, before, beside)
+    seconds      = {}
+
+    for label, deck in (('now', before), ('best', after)):
+        timed          = simulate(dict(spec, deck=deck), steps)
+        seconds[label] = sum(command.seconds for _, command in timed)
+
+    print(f'== {name} ==')
+    print(f'{"labware":<16} {"":<52} {"now":>4} {"best":>5}')
+    for lw, (load_name, slot) in before['labware'].items():
+        mark = '' if after['labware'][lw][1] == slot else '   <-- move'
+        print(f'{lw:<16} {load_name:<52} {slot:>4} {after["labware"][lw][1]:>5}{mark}')
+
+    print(f'travel {travel_mm(steps, before):.0f} mm -> {mm:.0f} mm, '
+          f'run {_minutes(seconds["now"]).strip()} -> {_minutes(seconds["best"]).strip()} '
+          f'({seconds["now"] - seconds["best"]:.1f} s saved)')
+    print()
+
+    return after
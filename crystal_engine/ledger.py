@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-run reagent ledger.
+
+Adds up every draw the plan will make from every source tube (reverse
+pipetting cushions and split runs included) before the first tip is picked
+up, so a run that would empty a tube halfway through a plate never starts.
+A recommended fill never goes past what the tube holds; a reagent that
+needs more has to be split over several tubes or moved to a bigger one, and
+the report says so.
+
+    python -m crystal_engine ledger OT2_HEWL_PC.py
+"""
+
+from math import ceil, floor
+
+from .deck import custom_definitions
+from .engine import DEFAULT_DECK, plan_plate
+from .vials import VIAL_MODELS
+
+
+MARGIN    = 0.05  # recommend 5% more than the run needs
+FILL_STEP = 0.5   # mL, round recommendations up to this
+
+
+class SourceVolumeError(ValueError):
+    pass
+
+
+
+# liquid a tube cannot give up: whatever is left when the tip sits on its floor
+def dead_volume(vialName):
+    model = VIAL_MODELS.get(vialName)
+    if model is None:
+        return 0.0
+    return model.volume_at(model.floor + model.immersion)
+
+
+
+# what the tube holds (uL): the custom labware well's totalLiquidVolume, else
+# the tube model's maxVolume
+def capacity(source, deck):
+    definition = custom_definitions().get(deck['labware'][source['labware']][0])
+    if definition is not None:
+        return definition['wells'][source['well']]['totalLiquidVolume']
+    model = VIAL_MODELS.get(source['vial'])
+    return model.max_uL if model is not None else float('inf')
+
+
+
+# per source: start, how much goes into wells, how much rides in cushions,
+# what is left at the end, what the tube holds and the fill we would recommend
+# (all uL but the fill). tubes is how many full tubes it takes when one is not
+# enough, 1 otherwise
+
+def ledger(spec, steps=None):
+    steps   = plan_plate(spec) if steps is None else steps
+    deck    = spec.get('deck') or DEFAULT_DECK
+    entries = {}
+
+    for name, source in spec['sources'].items():
+        entries[name] = {'start': source['volume'] * 1000, 'wells': 0.0, 'cushion': 0.0,
+                         'dead': dead_volume(source['vial']), 'capacity': capacity(source, deck)}
+
+    for step in steps:
+        if step.kind != 'aspirate' or step.reagent not in entries:
+            continue
+        # a draw that is not for a well is the reverse pipetting cushion. An
+        # 8-channel draw takes its volume once per channel
+        key                        = 'wells' if step.well is not None else 'cushion'
+        entries[step.reagent][key] = entries[step.reagent][key] + step.volume * (step.channels or 1)
+
+    for entry in entries.values():
+        need                 = entry['wells'] + entry['cushion']
+        entry['draw']        = need
+        entry['left']        = entry['start'] - need
+        fill                 = (need * (1 + MARGIN) + entry['dead']) / 1000
+        full                 = floor(entry['capacity'] / 1000 / FILL_STEP) * FILL_STEP
+        entry['recommended'] = min(ceil(fill / FILL_STEP) * FILL_STEP, full) if need else 0
+        entry['tubes']       = 1
+        if fill > full:
+            entry['tubes']   = ceil(need * (1 + MARGIN) / (full * 1000 - entry['dead']))
+
+    return entries
+
+
+
+# raise before anything moves if a tube would be drawn past its dead volume
+
+def check_volumes(spec, steps=None):
+    entries = ledger(spec, steps)
+    short   = [name for name, e in entries.items() if e['draw'] and e['left'] < e['dead']]
+
+    if short:
+        lines = []
+        for name in short:
+            e      = entries[name]
+            source = spec['sources'][name]
+            lines.append(f"{name} ({source['labware']} {source['well']}) needs {e['draw'] / 1000:.2f} mL "
+                         f"but starts with {e['start'] / 1000:g} mL; {fill_advice(e)}")
+        raise SourceVolumeError('not enough liquid for this run:\n  ' + '\n  '.join(lines))
+
+    return entries
+
+
+
+def fill_advice(entry):
+    if entry['tubes'] > 1:
+        return (f"that is more than one {entry['capacity'] / 1000:g} mL tube holds, split it over "
+                f"{entry['tubes']} tubes of {entry['recommended']:g} mL or move it to a bigger tube")
+    return f"fill it to {entry['recommended']:g} mL"
+
+
+
+def ledger_report(spec, name='plate'):
+    entries = ledger(spec)
+
+    print(f'== {name} ==')
+    print(f'{"source":<12} {"start":>8} {"wells":>8} {"cushion":>8} {"left":>8} {"fill":>8}   (mL)')
+    for source, e in entries.items():
+        flag = '' if not e['draw'] or e['left'] >= e['dead'] else '   <-- runs dry'
+        if e['tubes'] > 1:
+            flag = f'   <-- {e["tubes"]} tubes of {e["recommended"]:g} mL, or a bigger tube'
+        print(f'{source:<12} {e["start"] / 1000:>8.2f} {e["wells"] / 1000:>8.2f} {e["cushion"] / 1000:>8.2f} '
+              f'{e["left"] / 1000:>8.2f} {e["recommended"]:>8.1f}{flag}')
+    print()
+
+    return entries
+
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Liquid classes: how each kind of liquid is drawn and dispensed.
+
+The scripts used one set of rates for everything (0.8 into the reservoir,
+0.5 for the drop, 0.5 everywhere in the mock), so thin buffers ran at the
+speed the precipitant needs. A LiquidClass carries what one class needs:
+
+    aspirate_rate, dispense_rate   relative to the pipette's flow rate
+    air_gap                        uL of air drawn after every source draw
+    delays                         settle delays per step kind (see delays.py)
+    touch_tip                      (v_offset, radius) of a tap on the source
+                                   tube after every draw, or None
+
+Reagents map to classes like for the delays ('liquid' in the source, else
+'buffer'). With a registry in the spec its rates replace the default
+reservoir_rate / mix_rate / drop_rate settings (one the spec's own settings
+set still wins, for every liquid) and its delays are the delay table,
+unless the spec brings its own 'delays':
+
+    spec['liquids'] = LIQUIDS
+"""
+
+from collections import namedtuple
+
+from .delays import ADAPTIVE_DELAYS
+
+
+LiquidClass = namedtuple('LiquidClass', ['aspirate_rate', 'dispense_rate', 'air_gap', 'delays', 'touch_tip'],
+                         defaults=[0, {}, None])
+
+
+# water and buffers go at full speed. Precipitant (4M salt, AmmSulf) keeps the
+# 0.8 reservoir dispense it always had. The tap on the tube wall the scripts
+# had commented out costs about a minute a plate, so it stays off; switch it
+# on with LIQUIDS['viscous']._replace(touch_tip=(-3, 0.85)). The drop keeps
+# its slow dispense; 'reservoir' is the mixed well contents (BLOCK 3 and the
+# reservoir half of a drop)
+LIQUIDS = {
+    'water':     LiquidClass(1.0, 1.0, 0, ADAPTIVE_DELAYS['water']),
+    'buffer':    LiquidClass(1.0, 1.0, 0, ADAPTIVE_DELAYS['buffer']),
+    'viscous':   LiquidClass(1.0, 0.8, 0, ADAPTIVE_DELAYS['viscous']),
+    'protein':   LiquidClass(1.0, 0.5, 0, ADAPTIVE_DELAYS['protein']),
+    'reservoir': LiquidClass(1.0, 1.0, 0, ADAPTIVE_DELAYS['reservoir']),
+}
+
+
+
+# the delay table a registry stands for
+
+def liquid_delays(liquids):
+    return {name: liquid.delays for name, liquid in liquids.items()}
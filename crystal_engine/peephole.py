@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Peephole pass over a plan's move_to steps.
+
+The planner brackets every reservoir dispense with move_to(above(well)), a
+climb to 10 mm over the well top before and after. The robot plans its own
+path between two commands anyway: inside one well it goes straight, between
+two wells of one labware it arcs just over the labware's tallest well, and
+between labware it climbs to the safe height first. A move_to that lies on
+the path the robot takes anyway does nothing but stop the gantry, and one
+that climbs above the in-labware arc makes it climb higher than it needs to.
+
+compact() drops a move_to when
+
+    it goes where the gantry already is,
+    it is on the straight line between its neighbours in the same well, or
+    it is straight above the well it leaves or the well it goes to (the
+    climb out of or the descent into that well).
+
+Moves the mix and drop blocks make inside one well to steer around the drop
+post are never on that straight line, so they stay. So does a move that is
+followed by a delay (the tip waits there) or whose neighbours belong to
+another pipette. Moves between labware keep the SAFE_Z climb, the robot adds
+it itself.
+
+    spec['compact'] = True
+"""
+
+from math import sqrt
+
+from .engine import DEFAULT_DECK
+from .scheduler import step_positions
+
+
+TOLERANCE = 0.01   # mm
+
+
+
+def _same_xy(a, b):
+    return abs(a[0] - b[0]) < TOLERANCE and abs(a[1] - b[1]) < TOLERANCE
+
+
+
+def _distance(a, b):
+    return sqrt(sum((a[k] - b[k]) ** 2 for k in range(3)))
+
+
+
+def _collinear(a, m, b):
+    return _distance(a, m) + _distance(m, b) - _distance(a, b) < TOLERANCE
+
+
+
+# (labware, well, xyz) of every step that goes somewhere, by step index
+
+def places(steps, deck):
+    placed = {id(step): (lw, xyz) for step, lw, xyz in step_positions(steps, deck)}
+    out    = {}
+
+    for i, step in enumerate(steps):
+        if id(step) in placed:
+            lw, xyz = placed[id(step)]
+            well    = step.target.well if step.target is not None else None
+            out[i]  = (lw, well, xyz)
+
+    return out
+
+
+
+# does the robot pass through m on its own way from prev to nxt?
+
+def on_path(prev, m, nxt):
+    prev_lw, prev_well, p = prev
+    m_lw, m_well, mp      = m
+    nxt_lw, nxt_well, n   = nxt
+
+    if (prev_lw, prev_well) == (m_lw, m_well) == (nxt_lw, nxt_well):
+        return _collinear(p, mp, n)
+
+    # the climb out of the well it leaves, or the descent into the next one
+    if (m_lw, m_well) == (prev_lw, prev_well) and _same_xy(mp, p) and mp[2] >= p[2] - TOLERANCE:
+        return True
+    if (m_lw, m_well) == (nxt_lw, nxt_well) and _same_xy(mp, n) and mp[2] >= n[2] - TOLERANCE:
+        return True
+    return False
+
+
+
+def compact(spec, steps):
+    deck   = spec.get('deck') or DEFAULT_DECK
+    placed = places(steps, deck)
+    order  = sorted(placed)
+    nxt    = dict(zip(order, order[1:]))
+    out    = []
+    prev   = None                      # index of the last kept step that went somewhere
+
+    for i, step in enumerate(steps):
+        if step.kind == 'move_to' and prev is not None and i in placed:
+            m = placed[i]
+
+            if m[:2] == placed[prev][:2] and _distance(m[2], placed[prev][2]) < TOLERANCE:
+                continue
+
+            n        = nxt.get(i)
+            waits    = i + 1 < len(steps) and steps[i + 1].kind == 'delay'
+            same_pip = n is not None and steps[prev].pipette == step.pipette == steps[n].pipette
+            if same_pip and not waits and on_path(placed[prev], m, placed[n]):
+                continue
+
+        if i in placed:
+            prev = i
+        out.append(step)
+
+    return out
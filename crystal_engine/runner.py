@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+What a protocol's run() calls: plan the plate, make sure it can finish, run it
+(from its last checkpoint if an earlier run of it was interrupted).
+"""
+
+from .cache import cached
+from .checkpoint import open_checkpoint, resume_message, resume_plan
+from .engine import DEFAULT_DECK, plan_plate, execute, encode_steps, decode_steps
+from .graph import task_graph, violations
+from .interleave import interleave
+from .ledger import check_volumes
+from .peephole import compact
+from .telemetry import open_telemetry, run_clock
+from .tips import with_tip_racks
+
+
+
+# the plan as it will run: drops interleaved and redundant moves dropped if
+# the spec asks for it. A plan that breaks the plate's task graph is refused.
+# An unchanged spec reads its plan back from the cache
+
+def plan_run(spec):
+    def compile_plan():
+        steps = plan_plate(spec)
+        if spec.get('interleave'):
+            steps = interleave(spec, steps)
+        if spec.get('compact'):
+            steps = compact(spec, steps)
+
+        broken = violations(task_graph(spec), spec, steps)
+        if broken:
+            raise ValueError(f'the plan breaks {len(broken)} task graph edges, e.g. {broken[0]}')
+        return steps
+
+    return cached('plan', spec, compile_plan, encode_steps, decode_steps)
+
+
+
+def run_plate(protocol, spec):
+    steps   = plan_run(spec)
+    deck    = spec.get('deck') or DEFAULT_DECK
+    todo    = steps
+    sources = spec['sources']
+    tips    = None
+
+    # carry on from where an interrupted run of the same plan stopped
+    # (crystal_engine.checkpoint)
+    checkpoint = open_checkpoint(protocol, spec, steps)
+    if checkpoint is not None and checkpoint.saved:
+        resume            = resume_plan(spec, steps, checkpoint.saved)
+        todo, sources     = resume.steps, resume.sources
+        tips              = resume.tips
+        checkpoint.resume(resume)
+        deck              = with_tip_racks(deck, steps[:resume.start] + todo)
+        protocol.pause(resume_message(checkpoint.saved))
+
+    # fail before the first tip is picked up rather than halfway through a plate
+    check_volumes(dict(spec, sources=sources), todo)
+
+    # a JSON-lines step log if the spec asks for one (crystal_engine.telemetry)
+    logs = [log for log in (open_telemetry(protocol, spec, todo, deck), checkpoint) if log is not None]
+    try:
+        execute(protocol, todo, deck, logs, run_clock(protocol), tips)
+    finally:
+        for log in logs:
+            log.close()
+
+    if checkpoint is not None:
+        checkpoint.finish()
+    return steps
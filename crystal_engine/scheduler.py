@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Well visit ordering and travel estimates.
+
+Every block used to walk the wells A1..A6, B1..B6, ... The scheduler reorders
+the visits per block (serpentine rows, or a nearest-neighbour tour cleaned up
+with 2-opt) from the real deck coordinates, and measures the gantry travel of
+a planned run so orderings can be compared. An order that would break the
+plate's task graph (crystal_engine.graph) is not used.
+"""
+
+from math import hypot
+
+from .cache import cached
+from .deck import TRASH, channels, position, leg_mm, well_names
+from .engine import DEFAULT_DECK, PLATE, mix_mode, plan_plate, plates
+from .graph import task_graph, violations
+from .tips import with_tip_racks
+
+
+
+# absolute position of every step that goes somewhere, as (labware, xyz).
+# Tips come off each rack in order and go to the trash in slot 12
+
+def step_positions(steps, deck=None):
+    deck      = with_tip_racks(deck or DEFAULT_DECK, steps)
+    labware   = deck['labware']
+    tips_used = {pip: 0 for pip in deck['pipettes']}
+    tip_wells = {rack: well_names(labware[rack][0]) for _, _, racks in deck['pipettes'].values() for rack in racks}
+
+    for step in steps:
+        if step.kind == 'pick_up_tip':
+            racks     = deck['pipettes'][step.pipette][2]
+            per_rack  = len(tip_wells[racks[0]])
+            rack      = racks[min(tips_used[step.pipette] // per_rack, len(racks) - 1)]
+            tip       = tip_wells[rack][tips_used[step.pipette] % per_rack]
+            tips_used[step.pipette] = tips_used[step.pipette] + channels(deck['pipettes'][step.pipette][0])
+            yield step, rack, position(labware[rack][0], labware[rack][1], tip)
+
+        elif step.kind == 'drop_tip':
+            yield step, 'trash', TRASH
+
+        elif step.target is not None:
+            t               = step.target
+            load_name, slot = labware[t.labware]
+            yield step, t.labware, position(load_name, slot, t.well, t.ref, t.z, t.x, t.y)
+
+
+
+# gantry travel (mm) for a plan, per block. A leg counts toward the block of
+# the step it ends on
+
+def travel_by_block(steps, deck=None):
+    totals   = {}
+    previous = None
+
+    for step, lw, xyz in step_positions(steps, deck):
+        if previous is not None:
+            leg                = leg_mm(previous[1], xyz, previous[0] == lw)
+            totals[step.block] = totals.get(step.block, 0.0) + leg
+        previous = (lw, xyz)
+
+    return totals
+
+
+
+def travel_mm(steps, deck=None):
+    return sum(travel_by_block(steps, deck).values())
+
+
+
+def dist(a, b):
+    return hypot(a[0] - b[0], a[1] - b[1])
+
+
+
+# A1..A6, B6..B1, C1..C6, ... so every row starts where the last one ended
+
+def serpentine(wells):
+    rows = {}
+    for well in wells:
+        rows.setdefault(well[0], []).append(well)
+
+    order = []
+    for i, letter in enumerate(sorted(rows)):
+        row = sorted(rows[letter], key=lambda w: int(w[1:]))
+        order.extend(reversed(row) if i % 2 else row)
+
+    return order
+
+
+
+# nearest-neighbour open path from start, then 2-opt until nothing improves
+
+def tour(wells, xy, start):
+    remaining = list(wells)
+    order     = []
+    here      = start
+
+    while remaining:
+        nearest = min(remaining, key=lambda w: dist(here, xy[w]))
+        remaining.remove(nearest)
+        order.append(nearest)
+        here = xy[nearest]
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(order) - 1):
+            a = start if i == 0 else xy[order[i - 1]]
+            for j in range(i + 1, len(order)):
+                b      = xy[order[j + 1]] if j + 1 < len(order) else None
+                before = dist(a, xy[order[i]]) + (dist(xy[order[j]], b) if b else 0)
+                after  = dist(a, xy[order[j]]) + (dist(xy[order[i]], b) if b else 0)
+                if after < before - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+
+    return order
+
+
+
+# where each block keeps coming back to between wells
+
+def _block_start(spec, block, deck):
+    labware = deck['labware']
+    sources = spec['sources']
+
+    if block == 1:
+        source = sources[spec['reservoir'][0]]
+    elif block == 2:
+        source = sources[spec['water']['reagent']]
+    elif block == 4:
+        source = sources[spec['protein']]
+    else:
+        rack      = deck['pipettes']['p300'][2][0]
+        load_name = labware[rack][0]
+        return position(load_name, labware[rack][1], well_names(load_name)[0])[:2]
+
+    load_name, slot = labware[source['labware']]
+    return position(load_name, slot, source['well'])[:2]
+
+
+
+# spec with one plate's per block orders replaced
+
+def with_orders(spec, plate, orders):
+    if not spec.get('plates'):
+        return dict(spec, orders=orders)
+
+    batch        = dict(spec['plates'])
+    batch[plate] = dict(batch[plate], orders=orders)
+    return dict(spec, plates=batch)
+
+
+
+# spec with every plate back in its listed well order
+
+def without_orders(spec):
+    for plate in plates(spec):
+        spec = with_orders(spec, plate, {})
+    return spec
+
+
+
+# per block well orders for one plate's 'orders'. strategy is 'serpentine' or
+# 'tour'. Tips are swapped on what the wells hold rather than on rows, so any
+# order keeps the same tip count. A block keeps its original order if the new
+# one does not actually travel less, and the plate keeps all of them if the
+# new orders break the task graph
+
+def schedule(spec, strategy='tour', plate=PLATE):
+    deck            = spec.get('deck') or DEFAULT_DECK
+    load_name, slot = deck['labware'][plate]
+    wells           = plates(spec)[plate]['wells']
+    xy              = {w: position(load_name, slot, w)[:2] for w in wells}
+    orders          = {}
+
+    blocks          = [1] + [n for n, key in ((2, 'water'), (4, 'protein')) if spec.get(key)]
+    if mix_mode(spec) == 'pass':
+        blocks.append(3)
+
+    for block in blocks:
+        if strategy == 'serpentine':
+            orders[block] = serpentine(wells)
+            continue
+
+        orders[block] = tour(wells, xy, _block_start(spec, block, deck))
+
+    scheduled = with_orders(spec, plate, orders)
+    steps     = plan_plate(scheduled)
+    if violations(task_graph(scheduled), scheduled, steps):
+        return {}
+
+    before = travel_by_block(plan_plate(with_orders(spec, plate, {})), deck)
+    after  = travel_by_block(steps, deck)
+
+    return {block: order for block, order in orders.items()
+            if after.get(block, 0) < before.get(block, 0)}
+
+
+
+# spec with every plate scheduled, one plate after the other. The orders of
+# a spec that was scheduled before come from the cache
+
+def schedule_plates(spec, strategy='tour'):
+    def orders():
+        return {plate: schedule(spec, strategy, plate) for plate in plates(spec)}
+
+    found = cached('orders/' + strategy, spec, orders,
+                   decode=lambda data: {plate: {int(block): order for block, order in o.items()}
+                                        for plate, o in data.items()})
+
+    for plate, o in found.items():
+        spec = with_orders(spec, plate, o)
+    return spec
+
+
+
+# estimated travel before and after scheduling, per block and in total
+
+def travel_report(spec, strategy='tour'):
+    deck   = spec.get('deck') or DEFAULT_DECK
+    spec   = without_orders(spec)
+    before = travel_by_block(plan_plate(spec), deck)
+    after  = travel_by_block(plan_plate(schedule_plates(spec, strategy)), deck)
+
+    print(f'{"block":>8} {"before (mm)":>12} {"after (mm)":>12}')
+    for block in sorted(before):
+        print(f'{block:>8} {before[block]:>12.0f} {after.get(block, 0):>12.0f}')
+
+    b, a = sum(before.values()), sum(after.values())
+    print(f'{"total":>8} {b:>12.0f} {a:>12.0f}   ({100 * (b - a) / b:.1f}% less travel)')
+
+    return b, a
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative screens: the well_information matrix from a few gradient rules
+instead of a per-well if/elif ladder.
+
+A screen maps every reagent to one rule:
+
+    screen = {
+        'buffer46': Rows({'A': 50}),                    # 50 uL in row A, 0 elsewhere
+        'buffer48': Rows({'CD': 50}),                   # rows C and D
+        'water':    Gradient(50, column_step=-10),      # 50, 40, ... across the columns
+        'precip':   Fill(400),                          # whatever tops the well up to 400
+    }
+    well_information = build_plate(screen, grid_wells(24))
+
+Each rule is evaluated for the whole plate in one pass over the row and
+column index vectors, so 96 well (or bigger) screens cost no more per well
+than a 24 well one.
+"""
+
+from collections import namedtuple
+
+
+# rows and columns of the plate formats we screen in
+LAYOUTS = {
+    24: ('ABCD',     6),
+    48: ('ABCDEF',   8),
+    96: ('ABCDEFGH', 12),
+}
+
+
+# start + row_step per row down from A + column_step per column right of 1
+Gradient = namedtuple('Gradient', ['start', 'row_step', 'column_step'], defaults=[0, 0])
+
+# {row letters: uL}, 0 in every row not listed. 'CD' covers rows C and D
+Rows     = namedtuple('Rows', ['values'])
+
+# {column numbers: uL}, 0 in every column not listed
+Columns  = namedtuple('Columns', ['values'])
+
+# the rest of the well up to total, after every other reagent
+Fill     = namedtuple('Fill', ['total'])
+
+
+
+# A1, A2, ... row by row, like the scripts have always listed them
+
+def grid_wells(size):
+    rows, columns = LAYOUTS[size]
+    return [letter + str(number) for letter in rows for number in range(1, columns + 1)]
+
+
+
+def _expand(values):
+    return {key: volume for keys, volume in values.items()
+            for key in (keys if isinstance(keys, (str, tuple, list)) else [keys])}
+
+
+
+# one rule over every well at once. r and c are the row and column indexes
+# (0 based) of the wells
+
+def _evaluate(rule, wells, r, c):
+    if isinstance(rule, Gradient):
+        return [rule.start + rule.row_step * ri + rule.column_step * ci for ri, ci in zip(r, c)]
+
+    if isinstance(rule, Rows):
+        values = _expand(rule.values)
+        return [values.get(well[0], 0) for well in wells]
+
+    if isinstance(rule, Columns):
+        values = _expand(rule.values)
+        return [values.get(ci + 1, 0) for ci in c]
+
+    raise ValueError(f'unknown screen rule {rule!r}')
+
+
+
+# {well: {reagent: uL}} for wells, reagents in the order the screen lists them
+
+def build_plate(screen, wells):
+    r       = [ord(well[0]) - ord('A') for well in wells]
+    c       = [int(well[1:]) - 1 for well in wells]
+    columns = {}
+    fills   = []
+
+    for reagent, rule in screen.items():
+        if isinstance(rule, Fill):
+            fills.append(reagent)
+        else:
+            columns[reagent] = _evaluate(rule, wells, r, c)
+
+    if len(fills) > 1:
+        raise ValueError(f'only one reagent can fill the wells up, not {fills}')
+
+    for reagent in fills:
+        given            = [sum(v) for v in zip(*columns.values())] or [0] * len(wells)
+        columns[reagent] = [screen[reagent].total - g for g in given]
+
+    for reagent, volumes in columns.items():
+        short = [w for w, v in zip(wells, volumes) if v < 0]
+        if short:
+            raise ValueError(f'{reagent} comes out negative in {", ".join(short)}')
+
+    rows = zip(*(columns[reagent] for reagent in screen))
+    return {well: dict(zip(screen, volumes)) for well, volumes in zip(wells, rows)}
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the parts of the opentrons Protocol API the scripts use.
+
+FakeProtocolContext loads labware from crystal_engine.deck, hands out
+FakeInstruments that track tips, volume and gantry position, and records
+every command with an estimated duration into a CommandLog (one flat array
+per field). No robot and no opentrons package needed, so any script's run()
+executes in milliseconds on any Linux box (or in CI).
+"""
+
+import sys
+from array import array
+from collections import namedtuple
+from math import hypot
+from types import ModuleType, SimpleNamespace
+
+from .deck import SAFE_Z, TRASH, channels, position, well_geometry, well_names
+
+
+# gantry and pipette timing, close to the OT-2 defaults
+GANTRY_SPEED = 400    # mm/s in x/y
+Z_SPEED      = 125    # mm/s
+PICK_UP_TIP  = 3.0    # sec, press and retract once above the tip
+DROP_TIP     = 2.0    # sec, eject once above the trash
+TOUCH_TIP    = 1.5    # sec, four touches around the well
+
+# between two wells of one labware the OT-2 arcs this far over its tallest well
+IN_LABWARE_CLEARANCE = 5.0   # mm
+
+# (max volume uL, aspirate uL/s, dispense uL/s)
+PIPETTES = {
+    'p10_single':       (10,  5,     10),
+    'p10_multi':        (10,  5,     10),
+    'p20_single_gen2':  (20,  7.56,  7.56),
+    'p20_multi_gen2':   (20,  7.6,   7.6),
+    'p300_single_gen2': (300, 92.86, 92.86),
+    'p300_multi_gen2':  (300, 94,    94),
+}
+
+
+# one recorded robot command and how long it is expected to take, travel
+# being the part of seconds the gantry spends getting to x, y, z
+Command = namedtuple('Command', ['kind', 'pipette', 'volume', 'x', 'y', 'z', 'labware', 'seconds', 'travel'],
+                     defaults=[0.0])
+
+KINDS   = ('pick_up_tip', 'drop_tip', 'aspirate', 'dispense', 'move_to', 'touch_tip', 'blow_out', 'delay',
+           'air_gap')
+_KIND   = {kind: n for n, kind in enumerate(KINDS)}
+_NAN    = float('nan')
+
+
+
+# recorded commands as parallel arrays: kinds, pipette and labware names as
+# small codes, numbers as doubles (nan for None). About a quarter of the memory
+# of a list of Commands; indexing and iterating still hand out Commands
+
+class CommandLog:
+
+    NUMBERS = ('volume', 'x', 'y', 'z', 'seconds', 'travel')
+
+    def __init__(self):
+        self.kinds    = array('B')
+        self.pipettes = array('H')
+        self.labware  = array('H')
+        self.columns  = {field: array('d') for field in self.NUMBERS}
+        self.names    = [None]
+        self._codes   = {None: 0}
+
+
+    def _code(self, name):
+        if name not in self._codes:
+            self._codes[name] = len(self.names)
+            self.names.append(name)
+        return self._codes[name]
+
+
+    def append(self, command):
+        self.kinds.append(_KIND[command.kind])
+        self.pipettes.append(self._code(command.pipette))
+        self.labware.append(self._code(command.labware))
+        for field in self.NUMBERS:
+            value = getattr(command, field)
+            self.columns[field].append(_NAN if value is None else value)
+
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        number = {field: self.columns[field][i] for field in self.NUMBERS}
+        number = {field: (None if v != v else v) for field, v in number.items()}
+        return Command(KINDS[self.kinds[i]], self.names[self.pipettes[i]], number['volume'],
+                       number['x'], number['y'], number['z'], self.names[self.labware[i]], number['seconds'],
+                       number['travel'])
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    # how many of each kind of command
+    def counts(self):
+        found = {}
+        for code in self.kinds:
+            found[KINDS[code]] = found.get(KINDS[code], 0) + 1
+        return found
+
+
+    def total_seconds(self):
+        return sum(self.columns['seconds'])
+
+
+
+class Point(namedtuple('Point', ['x', 'y', 'z'], defaults=[0.0, 0.0, 0.0])):
+    __slots__ = ()
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Point(self.x - other.x, self.y - other.y, self.z - other.z)
+
+
+
+class Location(namedtuple('Location', ['point', 'labware'])):
+    __slots__ = ()
+
+    def move(self, point):
+        return Location(self.point + point, self.labware)
+
+
+# drop-in for `from opentrons import types`
+types = SimpleNamespace(Point=Point, Location=Location)
+
+
+
+class FakeWell:
+
+    def __init__(self, labware, name):
+        self.parent    = labware
+        self.well_name = name
+        self._top      = Point(*position(labware.load_name, labware.slot, name))
+        self.depth     = well_geometry(labware.load_name, name)[3]
+
+    def top(self, z=0.0):
+        return Location(self._top + Point(z=z), self)
+
+    def bottom(self, z=0.0):
+        return Location(self._top + Point(z=z - self.depth), self)
+
+    def center(self):
+        return Location(self._top + Point(z=-self.depth / 2), self)
+
+    def __repr__(self):
+        return f'{self.well_name} of {self.parent}'
+
+
+
+class FakeLabware:
+
+    def __init__(self, load_name, slot, label=None):
+        self.load_name = load_name
+        self.slot      = int(slot)
+        self.name      = label or load_name
+        self._wells    = {name: FakeWell(self, name) for name in well_names(load_name)}
+        self.highest_z = max(w._top.z for w in self._wells.values())
+
+    def __getitem__(self, name):
+        return self._wells[name]
+
+    def wells(self):
+        return list(self._wells.values())
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def __repr__(self):
+        return f'{self.name} on {self.slot}'
+
+
+
+class FakeInstrument:
+
+    def __init__(self, protocol, name, mount, tip_racks=None):
+        max_volume, aspirate, dispense = PIPETTES[name]
+
+        self.protocol       = protocol
+        self.name           = name
+        self.mount          = mount
+        self.tip_racks      = list(tip_racks or [])
+        self.max_volume     = max_volume
+        self.channels       = channels(name)
+        self.flow_rate      = SimpleNamespace(aspirate=aspirate, dispense=dispense, blow_out=dispense)
+        self.has_tip        = False
+        self.current_volume = 0
+        self._tips          = [well for rack in self.tip_racks for well in rack.wells()]
+
+    def _record(self, kind, location=None, volume=None, seconds=0):
+        self.protocol._record(kind, self.name, location, volume, seconds)
+
+    # like the robot: pick_up_tip() carries on from this tip
+    @property
+    def starting_tip(self):
+        return self._tips[0] if self._tips else None
+
+    @starting_tip.setter
+    def starting_tip(self, well):
+        every      = [w for rack in self.tip_racks for w in rack.wells()]
+        self._tips = every[every.index(well):]
+
+    def pick_up_tip(self, location=None):
+        if self.has_tip:
+            raise RuntimeError(f'{self.name} already has a tip')
+        if location is None:
+            # a multichannel takes a whole column of tips
+            if len(self._tips) < self.channels:
+                raise RuntimeError(f'{self.name} is out of tips')
+            location = self._tips[0]
+            del self._tips[:self.channels]
+        self._record('pick_up_tip', _as_location(location), seconds=PICK_UP_TIP)
+        self.has_tip = True
+        return self
+
+    def drop_tip(self, location=None):
+        if not self.has_tip:
+            raise RuntimeError(f'{self.name} has no tip to drop')
+        trash = Location(Point(*TRASH), 'trash')
+        self._record('drop_tip', _as_location(location) if location else trash, seconds=DROP_TIP)
+        self.has_tip        = False
+        self.current_volume = 0
+        return self
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        if not self.has_tip:
+            raise RuntimeError(f'{self.name} cannot aspirate without a tip')
+        volume = self.max_volume - self.current_volume if volume is None else volume
+        if self.current_volume + volume > self.max_volume + 1e-6:
+            raise ValueError(f'{self.name} cannot hold {self.current_volume + volume} uL')
+        self._record('aspirate', location, volume, volume / (self.flow_rate.aspirate * rate))
+        self.current_volume = self.current_volume + volume
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        # like the robot, never push out more than is in the tip
+        volume = self.current_volume if volume is None else min(volume, self.current_volume)
+        self._record('dispense', location, volume, volume / (self.flow_rate.dispense * rate))
+        self.current_volume = self.current_volume - volume
+        return self
+
+    # air drawn where the tip is, so no travel
+    def air_gap(self, volume=None, height=None):
+        if not self.has_tip:
+            raise RuntimeError(f'{self.name} cannot draw an air gap without a tip')
+        volume = self.max_volume - self.current_volume if volume is None else volume
+        if self.current_volume + volume > self.max_volume + 1e-6:
+            raise ValueError(f'{self.name} cannot hold {self.current_volume + volume} uL')
+        self._record('air_gap', None, volume, volume / self.flow_rate.aspirate)
+        self.current_volume = self.current_volume + volume
+        return self
+
+    def move_to(self, location, **kwargs):
+        self._record('move_to', location)
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        if location is not None:
+            location = _as_location(location).move(Point(z=v_offset))
+        self._record('touch_tip', location, seconds=TOUCH_TIP)
+        return self
+
+    def blow_out(self, location=None):
+        self._record('blow_out', location, seconds=0.5)
+        self.current_volume = 0
+        return self
+
+
+
+def _as_location(where):
+    return where.top() if isinstance(where, FakeWell) else where
+
+
+def _labware_of(location):
+    where = location.labware
+    return where.parent if isinstance(where, FakeWell) else where
+
+
+
+class FakeProtocolContext:
+
+    # simulating=False makes it stand in for a real run (checkpoints are only
+    # written then, see crystal_engine.checkpoint)
+    def __init__(self, simulating=True):
+        self.simulating = simulating
+        self.commands   = CommandLog()
+        self.elapsed    = 0.0
+        self.labware    = {}
+        self._here      = None   # (labware, well, Point) the gantry is at
+
+    def load_labware(self, load_name, location, label=None):
+        lw = FakeLabware(load_name, location, label)
+        self.labware[lw.slot] = lw
+        return lw
+
+    def load_labware_from_definition(self, labware_def, location, label=None):
+        return self.load_labware(labware_def['parameters']['loadName'], location, label)
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None, replace=False):
+        return FakeInstrument(self, instrument_name, mount, tip_racks)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._record('delay', None, None, None, seconds + 60 * minutes)
+
+    def comment(self, msg):
+        pass
+
+    def pause(self, msg=None):
+        pass
+
+    def is_simulating(self):
+        return self.simulating
+
+    def home(self):
+        self._here = None
+
+    # travel time from where the gantry is to location. Straight inside one
+    # well, over the labware's tallest well between two of its wells, up to
+    # SAFE_Z and over when it changes labware
+    def _travel(self, location):
+        if location is None:
+            return 0.0
+
+        labware, point = _labware_of(location), location.point
+        well           = location.labware if isinstance(location.labware, FakeWell) else None
+        seconds        = 0.0
+
+        if self._here is not None:
+            here_lw, here_well, here = self._here
+            flat                     = hypot(point.x - here.x, point.y - here.y)
+
+            if here_lw is labware and (here_well is well or not isinstance(labware, FakeLabware)):
+                seconds = max(flat / GANTRY_SPEED, abs(point.z - here.z) / Z_SPEED)
+            else:
+                top     = labware.highest_z + IN_LABWARE_CLEARANCE if here_lw is labware else SAFE_Z
+                climb   = max(top - here.z, 0) + max(top - point.z, 0)
+                seconds = climb / Z_SPEED + flat / GANTRY_SPEED
+
+        self._here = (labware, well, point)
+        return seconds
+
+    def _record(self, kind, pipette, location, volume, seconds):
+        travel  = self._travel(location)
+        seconds = seconds + travel
+        x = y = z = name = None
+
+        if location is not None:
+            x, y, z = location.point
+            labware = _labware_of(location)
+            name    = getattr(labware, 'name', labware)
+
+        self.commands.append(Command(kind, pipette, volume, x, y, z, name, seconds, travel))
+        self.elapsed = self.elapsed + seconds
+
+
+
+# make `from opentrons import protocol_api, types` work when the real package
+# is not installed, so the protocol scripts can be imported offline
+
+def install():
+    try:
+        import opentrons  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    opentrons                 = ModuleType('opentrons')
+    protocol_api              = ModuleType('opentrons.protocol_api')
+    protocol_api.ProtocolContext   = FakeProtocolContext
+    protocol_api.InstrumentContext = FakeInstrument
+    protocol_api.Labware           = FakeLabware
+    protocol_api.Well              = FakeWell
+    fake_types                = ModuleType('opentrons.types')
+    fake_types.Point          = Point
+    fake_types.Location       = Location
+    opentrons.protocol_api    = protocol_api
+    opentrons.types           = fake_types
+
+    sys.modules['opentrons']              = opentrons
+    sys.modules['opentrons.protocol_api'] = protocol_api
+    sys.modules['opentrons.types']        = fake_types
+    return True
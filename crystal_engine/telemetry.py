@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Run telemetry: one JSON line per executed step, and an offline analyzer.
+
+With 'telemetry' in the spec, run_plate times every step and writes what it
+did and how long it took next to what the plan expected:
+
+    {"run": "2023-10-22T22:42:18.120", "index": 12, "block": 1,
+     "kind": "aspirate", "pipette": "p300", "well": "A6", "reagent": "precip",
+     "volume": 120.0, "ref": "top", "z": -33.2, "tip": 1, "planned": 1.29,
+     "actual": 1.41}
+
+'run' is when the run started, 'planned' comes from a dry run on the
+FakeProtocolContext, 'tip' counts the tips the step's pipette has picked up
+so far and (ref, z) is the depth the step went to. Every run is added to the
+end of the log, so an interrupted run is still there next to the run that
+resumed it; the analyzer reports them one by one. Nothing is logged while
+the protocol is only being simulated (on upload, when the app analyses it
+again). Set 'telemetry' to a path, or to True for $CRYSTAL_ENGINE_TELEMETRY,
+/data/user_storage/crystal_engine_telemetry.jsonl on the robot or
+./crystal_engine_telemetry.jsonl anywhere else. Without it the executor does
+nothing extra.
+
+    python -m crystal_engine telemetry crystal_engine_telemetry.jsonl
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from .engine import execute
+from .simulate import FakeProtocolContext
+
+
+BLOCK_NAMES = {
+    1: 'BLOCK 1 reservoir',
+    2: 'BLOCK 2 water',
+    3: 'BLOCK 3 mix',
+    4: 'BLOCK 4 drops',
+}
+
+HOT_SPOTS = 10     # slowest steps against the plan the report lists
+
+
+
+def log_path(setting=True):
+    if isinstance(setting, str):
+        return setting
+    if os.environ.get('CRYSTAL_ENGINE_TELEMETRY'):
+        return os.environ['CRYSTAL_ENGINE_TELEMETRY']
+    if os.path.isdir('/data/user_storage'):
+        return '/data/user_storage/crystal_engine_telemetry.jsonl'
+    return 'crystal_engine_telemetry.jsonl'
+
+
+
+# seconds every step should take, from a dry run on the fake context
+def planned_seconds(steps, deck=None):
+    protocol = FakeProtocolContext()
+    execute(protocol, steps, deck)
+    return [round(seconds, 3) for seconds in protocol.commands.columns['seconds']]
+
+
+
+class Telemetry:
+
+    def __init__(self, path, planned=()):
+        self.path    = path
+        self.planned = list(planned)
+        self.tips    = {}
+        self.run     = datetime.now().isoformat(timespec='milliseconds')
+        self.file    = open(path, 'a')
+
+
+    def step(self, index, step, seconds):
+        if step.kind == 'pick_up_tip':
+            self.tips[step.pipette] = self.tips.get(step.pipette, 0) + 1
+
+        target = step.target
+        event  = {
+            'run':     self.run,
+            'index':   index,
+            'block':   step.block,
+            'kind':    step.kind,
+            'pipette': step.pipette,
+            'well':    step.well,
+            'reagent': step.reagent,
+            'volume':  step.volume,
+            'ref':     target.ref if target else None,
+            'z':       target.z if target else None,
+            'tip':     self.tips.get(step.pipette),
+            'planned': self.planned[index] if index < len(self.planned) else None,
+            'actual':  round(seconds, 3),
+        }
+        self.file.write(json.dumps(event) + '\n')
+
+
+    def close(self):
+        self.file.close()
+
+
+
+# what actual durations are measured on: the wall clock on the robot, the
+# fake context's own estimate when there is no robot
+def run_clock(protocol):
+    if isinstance(protocol, FakeProtocolContext):
+        return lambda: protocol.elapsed
+    return time.monotonic
+
+
+
+# the log for a run_plate call, or None when the spec does not ask for one
+# or the protocol is only being simulated
+def open_telemetry(protocol, spec, steps, deck=None):
+    if not spec.get('telemetry') or protocol.is_simulating():
+        return None
+    return Telemetry(log_path(spec['telemetry']), planned_seconds(steps, deck or spec.get('deck')))
+
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+
+# {run: its events} in the order the runs were logged
+def runs(events):
+    found = {}
+    for e in events:
+        found.setdefault(e.get('run'), []).append(e)
+    return found
+
+
+
+def _minutes(seconds):
+    return f'{int(seconds // 60):>3d}:{seconds % 60:04.1f}'
+
+
+
+# where the time went per block, and the steps that ran furthest over plan
+
+def telemetry_report(events, name='run'):
+    blocks = {}
+    for e in events:
+        row    = blocks.setdefault(e['block'], [0, 0.0, 0.0])
+        row[0] = row[0] + 1
+        row[1] = row[1] + (e['planned'] or 0)
+        row[2] = row[2] + e['actual']
+
+    planned = sum(row[1] for row in blocks.values())
+    actual  = sum(row[2] for row in blocks.values())
+
+    print(f'== {name}: {len(events)} steps, {_minutes(actual).strip()} actual, '
+          f'{_minutes(planned).strip()} planned ==')
+    print(f'{"":<20} {"steps":>6} {"planned":>9} {"actual":>9} {"over":>9}')
+    for block, (n, p, a) in sorted(blocks.items(), key=lambda kv: kv[0] or 0):
+        print(f'{BLOCK_NAMES.get(block, block):<20} {n:>6} {_minutes(p):>9} {_minutes(a):>9} {a - p:>+8.1f}s')
+
+    slow = sorted(events, key=lambda e: e['actual'] - (e['planned'] or 0), reverse=True)[:HOT_SPOTS]
+    slow = [e for e in slow if e['actual'] - (e['planned'] or 0) > 0]
+    if slow:
+        print('\nslowest against the plan:')
+    for e in slow:
+        what = ' '.join(str(e[k]) for k in ('kind', 'pipette', 'reagent', 'well') if e[k] is not None)
+        print(f'  #{e["index"]:<5} BLOCK {e["block"]} {what:<32} '
+              f'planned {e["planned"] or 0:6.2f} s, took {e["actual"]:6.2f} s')
+    print()
+
+    return {'planned': planned, 'actual': actual, 'blocks': blocks}
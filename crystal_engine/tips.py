@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tip budget: how many tips a plan picks up, per pipette and per BLOCK, and
+enough tip racks on the deck to cover it.
+
+Which transfers may share a tip is decided by the planner (see 'clean_tips'
+in crystal_engine.engine); this module only counts and provisions.
+"""
+
+from .deck import channels, free_slots, well_names
+
+
+# {pipette: {block: tip pickups}}; an 8-channel pickup takes a column of 8
+
+def tip_counts(steps):
+    counts = {}
+    for step in steps:
+        if step.kind == 'pick_up_tip':
+            per_block             = counts.setdefault(step.pipette, {})
+            per_block[step.block] = per_block.get(step.block, 0) + 1
+    return counts
+
+
+
+def racks_needed(deck, pipette, pickups):
+    model, _, racks = deck['pipettes'][pipette]
+    per_rack        = len(well_names(deck['labware'][racks[0]][0])) // channels(model)
+    return -(-pickups // per_rack)
+
+
+
+# a copy of deck with extra tip racks (same type as each pipette's first rack)
+# in free slots, for every pipette that would run out of tips otherwise
+
+def with_tip_racks(deck, steps):
+    counts = tip_counts(steps)
+    short  = {}
+
+    for pip, (model, mount, racks) in deck['pipettes'].items():
+        missing = racks_needed(deck, pip, sum(counts.get(pip, {}).values())) - len(racks)
+        if missing > 0:
+            short[pip] = missing
+
+    if not short:
+        return deck
+
+    labware  = dict(deck['labware'])
+    pipettes = dict(deck['pipettes'])
+    slots    = free_slots(deck)
+
+    for pip, missing in short.items():
+        model, mount, racks = pipettes[pip]
+        racks               = list(racks)
+
+        for n in range(missing):
+            if not slots:
+                raise ValueError(f'no free deck slot for another {pip} tip rack')
+            name          = f'{racks[0]}_{len(racks) + 1}'
+            labware[name] = (labware[racks[0]][0], slots.pop(0))
+            racks.append(name)
+
+        pipettes[pip] = (model, mount, racks)
+
+    return dict(deck, labware=labware, pipettes=pipettes)
+
+
+
+def tip_report(from_deck, steps, name='plate'):
+    counts    = tip_counts(steps)
+    deck      = with_tip_racks(from_deck, steps)
+    blocks    = sorted({block for per_block in counts.values() for block in per_block})
+
+    print(f'== {name} ==')
+    print(f'{"pipette":<8}' + ''.join(f' {"BLOCK " + str(b):>8}' for b in blocks) + f' {"total":>8} {"racks":>6}')
+    for pip, per_block in sorted(counts.items()):
+        total = sum(per_block.values())
+        print(f'{pip:<8}' + ''.join(f' {per_block.get(b, 0):>8}' for b in blocks) +
+              f' {total:>8} {racks_needed(deck, pip, total):>6}')
+
+    for lw, (load_name, slot) in deck['labware'].items():
+        if lw not in from_deck['labware']:
+            print(f'added {lw} ({load_name}) in slot {slot}')
+    print()
+
+    return counts
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Source tube geometry shared by every plate protocol.
+
+because we're using valuable reagents (or tricky reagents, like 4M salt buffer)
+let's control the depth of the pipette tip to prevent it from bottoming out.
+The default nature of the opentrons is to go to the very bottom of the tube,
+completely submerging the pipette and pipette arm. This could contaminate liquid
+sources.
+
+Each tube type gets a LiquidHeightModel: the straight wall from the
+calibration below, sitting on a conical tip that holds volume_offset. The
+cone runs from the calibrated level at volume_offset down to the bottom of
+the tube, which is where the opentrons rack definition puts the bottom of
+the well the tube stands in, so cone_height is that well depth less
+-offset. The volume -> liquid height curve is tabulated once at import, so
+every lookup is a table index instead of a fresh slope/intercept
+calculation.
+
+The tip never goes below bottom(2), like the scripts' getTopOffset: the
+model stops CLEARANCE above the tip of the cone, and with the depth of the
+labware well a tube stands in, vial_depths() holds every draw CLEARANCE
+above its bottom too.
+"""
+
+from array import array
+from bisect import bisect_left
+
+
+vialPipetteOffsets = {
+    "GREINER_50mL": {
+        "volume_offset": 5,    # mL, held by the conical tip
+        "volume_step":  50,    # mL
+        "offset":      -93.25, # mm, liquid height (from the top) at volume_offset
+        "step":         81.1,  # mm, rise from volume_offset to volume_step
+        "maxVolume":    50,    # mL
+        "cone_height":  19.75  # mm, conical tip below volume_offset: 113 mm
+                               # deep 50 mL wells of the falcon tube rack
+                          },
+
+    "USA_1.5mL": {
+        "volume_offset": 0.1,  # mL
+        "volume_step":  1.5,   # mL
+        "offset":      -31.1,  # mm
+        "step":         26.8,  # mm
+        "maxVolume":    1.5,   # mL
+        "cone_height":  6.8    # mm, nest 1.5 mL snapcap rack wells are 37.9 mm deep
+                          },
+
+    # one trough of a 12 well reservoir, flat bottomed, for the 8-channel p300
+    "NEST_12_15mL": {
+        "volume_offset": 0,    # mL
+        "volume_step":  15,    # mL
+        "offset":      -26.85, # mm, the floor
+        "step":         25.7,  # mm, 15 mL over 8.2 x 71.2 mm
+        "maxVolume":    15,    # mL
+        "cone_height":  0      # mm, no cone (the trough is 26.85 mm deep)
+                          },
+
+    "VMR_15mL": {
+        "volume_offset": 2,    # mL
+        "volume_step":  15,    # mL
+        "offset":      -93.2,  # mm
+        "step":         83.5,  # mm
+        "maxVolume":    15,    # mL
+        "cone_height":  24.3   # mm, the falcon rack's 15 mL wells are 117.5 mm deep
+                          }
+}
+
+
+SUBMERGE       = 0.03   # go below the surface by what 3% of the tube's volume is worth
+CLEARANCE      = 2      # mm, never closer than this to the bottom, the scripts' bottom(2)
+TABLE_SIZE     = 2000   # entries in each volume -> height table
+roundingDigits = 2
+
+
+
+class LiquidHeightModel:
+
+    def __init__(self, vial):
+        self.vial      = vial
+        self.max_uL    = vial['maxVolume'] * 1000
+        self.step_uL   = self.max_uL / TABLE_SIZE
+        self.apex      = vial['offset'] - vial['cone_height']
+        self.floor     = self.apex + CLEARANCE
+        self.mm_per_uL = vial['step'] / ((vial['volume_step'] - vial['volume_offset']) * 1000)
+        self.immersion = SUBMERGE * self.max_uL * self.mm_per_uL
+
+        # liquid surface (mm from the top of the tube) for every table volume
+        self.heights   = array('d', (self._surface(i * self.step_uL) for i in range(TABLE_SIZE + 1)))
+
+
+    # closed form: a cone (volume grows with height cubed) up to volume_offset,
+    # then the calibrated straight wall
+    def _surface(self, volume_uL):
+        vial       = self.vial
+        cone_uL    = vial['volume_offset'] * 1000
+        volume_uL  = min(max(volume_uL, 0), self.max_uL)
+
+        if volume_uL < cone_uL:
+            return self.apex + vial['cone_height'] * (volume_uL / cone_uL) ** (1 / 3)
+
+        return vial['offset'] + (volume_uL - cone_uL) * self.mm_per_uL
+
+
+    # O(1): index the table and interpolate between the two neighbours
+    def surface(self, volume_uL):
+        position = min(max(volume_uL, 0), self.max_uL) / self.step_uL
+        i        = min(int(position), TABLE_SIZE - 1)
+        low      = self.heights[i]
+        return low + (self.heights[i + 1] - low) * (position - i)
+
+
+    # how far below the top of the tube to aspirate with volume_uL left in it,
+    # and CLEARANCE above the bottom of a well_depth deep labware well
+    def depth(self, volume_uL, well_depth=None):
+        floor = self.floor if well_depth is None else max(self.floor, CLEARANCE - well_depth)
+        return round(max(self.surface(volume_uL) - self.immersion, floor), roundingDigits)
+
+
+    def depths(self, volumes_uL, well_depth=None):
+        return [self.depth(v, well_depth) for v in volumes_uL]
+
+
+    # depths for a whole series of draws from a tube that starts at start_uL.
+    # Each depth is taken after its draw, like the scripts always did
+    def draw_depths(self, start_uL, draws_uL):
+        left    = start_uL
+        volumes = []
+        for draw in draws_uL:
+            left = left - draw
+            volumes.append(left)
+        return self.depths(volumes)
+
+
+    # inverse lookup by bisection: how much liquid puts the surface at height
+    def volume_at(self, height):
+        i = bisect_left(self.heights, height)
+        if i == 0:
+            return 0.0
+        if i > TABLE_SIZE:
+            return self.max_uL
+        low, high = self.heights[i - 1], self.heights[i]
+        return (i - 1 + (height - low) / (high - low)) * self.step_uL
+
+
+
+VIAL_MODELS = {name: LiquidHeightModel(vial) for name, vial in vialPipetteOffsets.items()}
+
+
+
+# returns (reference, z) where reference is 'top' or 'bottom' of the tube, so
+# the planner can store depths without touching any opentrons objects
+
+def vial_depth(vialName, volume_uL, well_depth=None):
+
+    if vialName == "Sample_2mL":
+        return 'bottom', 5
+
+    return 'top', VIAL_MODELS[vialName].depth(volume_uL, well_depth)
+
+
+# the same for a whole batch of volumes in one go
+
+def vial_depths(vialName, volumes_uL, well_depth=None):
+
+    if vialName == "Sample_2mL":
+        return [('bottom', 5)] * len(volumes_uL)
+
+    return [('top', z) for z in VIAL_MODELS[vialName].depths(volumes_uL, well_depth)]
+
+
+# this function was largely written by Thomas Lauer with slight modifications
+# https://github.com/tjlauer/Opentrons_OT-2
+
+def getTopOffset(plate, vialLocation, vialName, volume_uL):
+
+    well   = plate[vialLocation]
+    ref, z = vial_depth(vialName, volume_uL, well.depth)
+
+    if ref == 'bottom':
+        return well.bottom(z)
+
+    return well.top(z)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# plans and orders go to a throwaway cache, not the one on this machine
+os.environ['CRYSTAL_ENGINE_CACHE'] = tempfile.mkdtemp(prefix='crystal_engine_test_')
+
+from collections import Counter
+
+import pytest
+
+from crystal_engine.deck import position, well_names
+from crystal_engine.engine import DEFAULT_DECK, plates
+from crystal_engine.estimate import load_protocol, simulate
+from crystal_engine.graph import task_graph, violations
+
+
+SCRIPTS = ['OT2_HEWL_PC.py', 'CJ_single_tip_V5.py', 'mock_crystal_testAll_V5.py']
+
+
+# {script: plate_spec()} of every protocol in the repo
+@pytest.fixture(scope='session')
+def specs():
+    return {name: load_protocol(os.path.join(ROOT, name)).plate_spec() for name in SCRIPTS}
+
+
+
+# the plate_spec() of each protocol in turn
+@pytest.fixture(params=SCRIPTS)
+def spec(request, specs):
+    return specs[request.param]
+
+
+
+# {(plate, well): uL} a plan leaves in every plate well when it runs on the
+# fake context: what the pipettes really put out there (never more than the
+# tip held) less what they drew back up, by the well nearest each command
+def run_volumes(spec, steps):
+    deck  = spec.get('deck') or DEFAULT_DECK
+    wells = []
+    for plate in plates(spec):
+        load_name, slot = deck['labware'][plate]
+        wells.extend((load_name, plate, well, position(load_name, slot, well)) for well in well_names(load_name))
+
+    totals = Counter()
+    for step, command in simulate(spec, steps):
+        if command.kind not in ('aspirate', 'dispense') or command.labware not in {w[0] for w in wells}:
+            continue
+        _, plate, well, xyz = min((w for w in wells if w[0] == command.labware),
+                                  key=lambda w: (w[3][0] - command.x) ** 2 + (w[3][1] - command.y) ** 2)
+        sign                 = 1 if command.kind == 'dispense' else -1
+        totals[plate, well] += sign * command.volume * (step.channels or 1)
+
+    return {key: round(uL, 6) for key, uL in totals.items() if round(uL, 6)}
+
+
+# a plan that reorders or rewrites another (scheduled, interleaved, compacted)
+# has to fill every plate well with what the other plan does and keep to the
+# plate's task graph. baseline_spec is the spec baseline was planned from, if
+# it is not spec
+def check_same_plate(spec, steps, baseline, baseline_spec=None):
+    assert run_volumes(spec, steps) == run_volumes(baseline_spec or spec, baseline)
+    assert violations(task_graph(spec), spec, steps) == []
+
+
+@pytest.fixture(scope='session')
+def same_plate():
+    return check_same_plate
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from crystal_engine import cache
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('CRYSTAL_ENGINE_CACHE', str(tmp_path))
+    return tmp_path
+
+
+# compute() for the cached() calls, counting how often it really runs
+class Compute:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls = self.calls + 1
+        return {'steps': self.calls}
+
+
+def test_an_unchanged_spec_is_computed_once(cache_dir, specs):
+    spec    = specs['OT2_HEWL_PC.py']
+    compute = Compute()
+
+    assert cache.cached('plan', spec, compute) == {'steps': 1}
+    assert cache.cached('plan', spec, compute) == {'steps': 1}
+    assert compute.calls == 1
+
+    assert cache.cached('plan', dict(spec, cache=False), compute) == {'steps': 2}
+
+
+def test_a_spec_or_engine_change_misses(cache_dir, specs, monkeypatch):
+    spec     = specs['OT2_HEWL_PC.py']
+    key      = cache.plan_key('plan', spec)
+    settings = dict(spec['settings'], depth=spec['settings']['depth'] - 1)
+
+    assert cache.plan_key('plan', dict(spec, settings=settings)) != key
+    assert cache.plan_key('orders', spec) != key
+
+    monkeypatch.setattr(cache, '_engine_digest', 'a changed engine')
+    assert cache.plan_key('plan', spec) != key
+
+
+def test_a_corrupt_entry_is_computed_again(cache_dir, specs):
+    spec    = specs['OT2_HEWL_PC.py']
+    compute = Compute()
+    cache.cached('plan', spec, compute)
+
+    path = os.path.join(str(cache_dir), cache.plan_key('plan', spec) + '.json')
+    with open(path, 'w') as f:
+        f.write('{"steps": ')
+
+    assert cache.cached('plan', spec, compute) == {'steps': 2}
+    assert cache.cached('plan', spec, compute) == {'steps': 2}
+
+
+def test_the_least_recently_used_go_first(cache_dir):
+    entry = ['x' * 100]
+    for n, key in enumerate(['a', 'b', 'c']):
+        cache.store(key, entry)
+        os.utime(os.path.join(str(cache_dir), key + '.json'), (n, n))
+    cache.load('a')                              # a is used again, b is now the oldest
+
+    size = os.path.getsize(os.path.join(str(cache_dir), 'a.json'))
+    cache.store('d', entry, max_bytes=3 * size)
+
+    assert sorted(os.listdir(str(cache_dir))) == ['a.json', 'c.json', 'd.json']
+    assert cache.load('b') is None
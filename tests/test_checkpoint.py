@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+from collections import Counter
+
+import pytest
+
+from crystal_engine.checkpoint import Checkpoint, resume_plan
+from crystal_engine.engine import DEFAULT_DECK, plates
+from crystal_engine.graph import done_at, landed
+from crystal_engine.runner import plan_run, run_plate
+from crystal_engine.simulate import FakeProtocolContext
+
+
+class Stop(Exception):
+    pass
+
+
+# a robot run that stops (a jam, an e-stop) before its command number at
+class Interrupted(FakeProtocolContext):
+
+    def __init__(self, at):
+        super().__init__(simulating=False)
+        self.at = at
+
+    def _record(self, *args):
+        if len(self.commands) == self.at:
+            raise Stop()
+        super()._record(*args)
+
+
+# {(plate, well, what): uL} the pipettes really put out into the plates, what
+# being the source reagent, 'drop' or 'mix' (a BLOCK 3 redispense)
+def delivered(spec, steps, commands, totals=None):
+    deck      = spec.get('deck') or DEFAULT_DECK
+    on_plates = set(plates(spec))
+    totals    = Counter() if totals is None else totals
+
+    for step, command in zip(steps, commands):
+        if step.kind != 'dispense' or step.target.labware not in on_plates:
+            continue
+        what = step.reagent or ('drop' if step.block == 4 else 'mix')
+        for plate, well in landed(step, deck):
+            totals[plate, well, what] += command.volume
+    return totals
+
+
+def rounded(totals, skip=('mix',)):
+    return {key: round(uL, 6) for key, uL in totals.items() if key[2] not in skip and round(uL, 6)}
+
+
+# run the plate, stopping before every command in stops in turn (a stop past
+# the end of a run finishes the plate), then once to the end; the plate's
+# deliveries over all the runs
+def run_with_stops(spec, stops):
+    steps  = plan_run(spec)
+    totals = Counter()
+    saved  = None
+
+    for at in list(stops) + [None]:
+        todo     = resume_plan(spec, steps, saved).steps if saved else steps
+        protocol = FakeProtocolContext(simulating=False) if at is None else Interrupted(at)
+        try:
+            run_plate(protocol, spec)
+            stopped = False
+        except Stop:
+            stopped = True
+        delivered(spec, todo, protocol.commands, totals)
+        if not stopped:
+            break
+
+        if os.path.exists(spec['checkpoint']):
+            with open(spec['checkpoint']) as f:
+                saved = json.load(f)
+        else:
+            saved = None
+
+    assert not os.path.exists(spec['checkpoint'])
+    return totals
+
+
+# a stop before step k leaves the plate with what the first k steps of an
+# uninterrupted run put there, and the file with the last point saved by then;
+# the run that resumes from it only depends on the point, so every point is
+# resumed once and every stop is checked from those
+@pytest.mark.parametrize('name', ['OT2_HEWL_PC.py', 'CJ_single_tip_V5.py', 'mock_crystal_testAll_V5.py'])
+def test_a_stop_at_any_step_delivers_each_well_exactly_once(specs, tmp_path, name):
+    spec       = dict(specs[name], checkpoint=str(tmp_path / 'checkpoint.json'), resume=True)
+    steps      = plan_run(spec)
+    protocol   = FakeProtocolContext(simulating=False)
+    run_plate(protocol, spec)
+    assert len(protocol.commands) == len(steps)
+    expected   = rounded(delivered(spec, steps, protocol.commands))
+    checkpoint = Checkpoint(spec['checkpoint'], spec, steps)
+
+    resumed = {}
+    for index in checkpoint.points:
+        checkpoint.step(index - 1, steps[index - 1], 0.0)
+        with open(spec['checkpoint']) as f:
+            todo = resume_plan(spec, steps, json.load(f)).steps
+        again = FakeProtocolContext(simulating=False)
+        run_plate(again, spec)
+        resumed[index] = delivered(spec, todo, again.commands)
+        assert not os.path.exists(spec['checkpoint'])
+
+    before = Counter()
+    saved  = None
+    for at in range(1, len(steps)):
+        delivered(spec, steps[at - 1:at], protocol.commands[at - 1:at], before)
+        saved = at if at in checkpoint.points else saved
+        after = resumed[saved] if saved else delivered(spec, steps, protocol.commands)
+        assert rounded(before + after) == expected, (name, at)
+
+
+def test_a_resumed_run_saves_points_of_the_original_plan(specs, tmp_path):
+    spec     = dict(specs['OT2_HEWL_PC.py'], checkpoint=str(tmp_path / 'checkpoint.json'), resume=True)
+    steps    = plan_run(spec)
+    expected = rounded(run_with_stops(spec, []))
+
+    for first in range(len(steps) // 10, len(steps), len(steps) // 7):
+        for second in (1, 5, 60):
+            assert rounded(run_with_stops(spec, [first, second])) == expected, (first, second)
+
+    # stop once, then look at the points the resumed run would save
+    try:
+        run_plate(Interrupted(len(steps) // 2), spec)
+    except Stop:
+        pass
+    checkpoint = Checkpoint(spec['checkpoint'], spec, steps)
+    resume     = resume_plan(spec, steps, checkpoint.saved)
+    checkpoint.resume(resume)
+
+    assert checkpoint.points
+    assert all(point['next'] > resume.start for point in checkpoint.points.values())
+    os.remove(spec['checkpoint'])
+
+
+def test_a_checkpoint_that_cannot_be_written_is_logged(specs, tmp_path, caplog):
+    spec       = dict(specs['OT2_HEWL_PC.py'], checkpoint=str(tmp_path / 'missing' / 'checkpoint.json'))
+    steps      = plan_run(spec)
+    checkpoint = Checkpoint(spec['checkpoint'], spec, steps)
+    index      = min(checkpoint.points) - 1
+
+    with caplog.at_level(logging.WARNING):
+        checkpoint.step(index, steps[index], 0.0)
+
+    assert 'could not save the checkpoint' in caplog.text
+
+
+
+# a well's task is done at its last dispense, not at the first of several
+def test_a_task_is_done_once_its_last_dispense_is_in(specs, tmp_path):
+    spec       = dict(specs['mock_crystal_testAll_V5.py'], checkpoint=str(tmp_path / 'checkpoint.json'))
+    steps      = plan_run(spec)
+    checkpoint = Checkpoint(spec['checkpoint'], spec, steps)
+    halfway    = 0
+
+    for index in checkpoint.points:
+        checkpoint.step(index - 1, steps[index - 1], 0.0)
+        with open(spec['checkpoint']) as f:
+            done = set(json.load(f)['done'])
+        started = set(done_at(spec, steps[:index]))
+        assert done == started - set(done_at(spec, steps[index:])), index
+        halfway = halfway + len(started - done)
+
+    assert halfway
+
+
+def test_a_checkpoint_is_not_resumed_without_resume(specs, tmp_path, caplog):
+    spec     = dict(specs['OT2_HEWL_PC.py'], checkpoint=str(tmp_path / 'checkpoint.json'))
+    steps    = plan_run(spec)
+    expected = rounded(run_with_stops(spec, []))
+
+    try:
+        run_plate(Interrupted(len(steps) // 2), spec)
+    except Stop:
+        pass
+    assert os.path.exists(spec['checkpoint'])
+
+    protocol = FakeProtocolContext(simulating=False)
+    with caplog.at_level(logging.WARNING):
+        run_plate(protocol, spec)
+
+    assert "set 'resume': True" in caplog.text
+    assert rounded(delivered(spec, steps, protocol.commands)) == expected
+    assert not os.path.exists(spec['checkpoint'])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from math import hypot
+
+import pytest
+
+from crystal_engine import DECK_96, LabwareError, PipetteError, Fill, Gradient, build_plate, grid_wells
+from crystal_engine.deck import custom_definitions, multichannel_columns
+from crystal_engine.engine import PLATE, PlanBuilder, plan_plate, water_pipettes
+
+
+PLATE_96 = DECK_96['labware'][PLATE][0]
+
+
+def spec_96(water=None, **extra):
+    wells  = grid_wells(96)
+    screen = {
+        'buffer': Gradient(20, column_step=2),     # the same down every column: 8-channel
+        'precip': Gradient(20, row_step=3),        # differs within a column: single channel
+        'water':  water or Fill(90),
+    }
+    sources = {name: {'labware': 'troughs', 'well': well, 'vial': 'NEST_12_15mL', 'volume': 15}
+               for name, well in (('buffer', 'A1'), ('precip', 'A2'), ('water', 'A3'))}
+    spec = {
+        'wells':            wells,
+        'well_information': build_plate(screen, wells),
+        'sources':          sources,
+        'reservoir':        ['buffer', 'precip'],
+        'water':            {'reagent': 'water'},
+        'multichannel':     'p300m',
+        'deck':             DECK_96,
+    }
+    spec.update(extra)
+    return spec
+
+
+# (x, y, z) of a target from the middle of its well's bottom, from the definition
+def from_bottom(target):
+    w = custom_definitions()[PLATE_96]['wells'][target.well]
+    z = target.z + {'top': w['depth'], 'center': w['depth'] / 2, 'bottom': 0}[target.ref]
+    return target.x, target.y, z
+
+
+@pytest.mark.parametrize('mix', [False, 'pass', 'last'])
+def test_every_96_well_target_is_inside_its_well(mix):
+    steps   = plan_plate(spec_96(mix=mix))
+    columns = multichannel_columns(PLATE_96)
+    checked = set()
+
+    for step in steps:
+        if step.target is None or step.target.labware != PLATE:
+            continue
+        x, y, z = from_bottom(step.target)
+        for well in columns[step.well] if step.channels == 8 else [step.target.well]:
+            w = custom_definitions()[PLATE_96]['wells'][well]
+            assert hypot(x, y) <= w['diameter'] / 2, (step, well)
+            assert z >= 0, (step, well)
+            if z <= w['depth']:
+                checked.add(well)
+
+    assert len(checked) == 96
+
+
+def test_96_well_plans_do_not_set_drops():
+    with pytest.raises(LabwareError, match='no drop well'):
+        plan_plate(spec_96(protein='buffer'))
+
+
+def test_planner_rejects_a_target_outside_the_well():
+    with pytest.raises(LabwareError, match='outside the well'):
+        plan_plate(spec_96(settings={'depth': -11}))
+    with pytest.raises(LabwareError, match='outside the well'):
+        plan_plate(spec_96(settings={'offset': 5.5}))
+
+
+
+# {(well, pipette, channels): [uL of every dispense]} of BLOCK 2
+def water_dispenses(steps):
+    found = {}
+    for s in steps:
+        if s.block == 2 and s.kind == 'dispense' and s.target.labware == PLATE:
+            found.setdefault((s.well, s.pipette, s.channels or 1), []).append(s.volume)
+    return found
+
+
+def test_96_well_water_goes_by_column_where_it_can():
+    by_column = water_dispenses(plan_plate(spec_96(water=Gradient(10, column_step=5))))
+    by_row    = water_dispenses(plan_plate(spec_96(water=Gradient(10, row_step=5))))
+
+    assert {(pip, n) for _, pip, n in by_column} == {('p300m', 8)}
+    assert len(by_column) == 12
+    assert {(pip, n) for _, pip, n in by_row} == {('p300', 1)}
+    assert len(by_row) == 96
+
+
+# a water volume bigger than the tip goes in equal runs that each fit
+def test_96_well_water_splits_into_runs_that_fit_the_tip():
+    b        = PlanBuilder(spec_96())
+    capacity = b.tip_capacity('p300', 'water')
+    volume   = capacity + 10
+    screen   = Gradient(volume, row_step=0.5)
+    runs     = water_dispenses(plan_plate(spec_96(water=screen, reservoir=['buffer'])))
+
+    split    = [volumes for volumes in runs.values() if sum(volumes) > capacity]
+
+    assert split
+    assert all(v <= capacity for volumes in runs.values() for v in volumes)
+    assert all(len(volumes) == 2 and volumes[0] == volumes[1] for volumes in split)
+
+
+def test_single_wells_without_a_single_channel_pipette_are_refused():
+    deck = dict(DECK_96, pipettes={'p300m': DECK_96['pipettes']['p300m']})
+    spec = spec_96(water=Gradient(10, row_step=5), reservoir=['buffer'], deck=deck)
+
+    with pytest.raises(PipetteError, match='single channel'):
+        plan_plate(spec)
+    assert water_pipettes(PlanBuilder(spec), 'water', []) == []
+
+
+# on the 24 well deck small volumes go to the p10, big ones to the p300, and
+# a pipette is only brought in when it saves more than its setup
+def test_water_goes_to_the_fastest_pipette_in_range(specs):
+    b = PlanBuilder(specs['OT2_HEWL_PC.py'])
+
+    assert water_pipettes(b, 'water', [2, 5, 150, 190]) == ['p10', 'p10', 'p300', 'p300']
+    assert water_pipettes(b, 'water', [9]) == ['p10']
+    assert water_pipettes(b, 'water', [150]) == ['p300']
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from crystal_engine.delays import ADAPTIVE_DELAYS, DEFAULT_CLASS, DelayPolicy, liquid_class
+from crystal_engine.engine import PlanBuilder
+from crystal_engine.liquids import LIQUIDS
+
+
+SOURCES = {
+    'precip':   {'liquid': 'viscous'},
+    'water':    {'liquid': 'water'},
+    'buffer46': {},
+}
+
+
+def test_every_source_has_its_class():
+    assert liquid_class('precip', SOURCES) == 'viscous'
+    assert liquid_class('buffer46', SOURCES) == DEFAULT_CLASS
+    assert liquid_class('unknown', SOURCES) == DEFAULT_CLASS
+    assert liquid_class(None, SOURCES) == 'reservoir'
+
+
+def test_each_class_waits_its_own_time():
+    policy = DelayPolicy(ADAPTIVE_DELAYS, SOURCES)
+
+    for reagent, name in (('precip', 'viscous'), ('water', 'water'), ('buffer46', 'buffer'), (None, 'reservoir')):
+        for kind in ('pick_up_tip', 'aspirate', 'dispense', 'move_to', 'touch_tip', 'drop_tip'):
+            assert policy.seconds(kind, reagent) == ADAPTIVE_DELAYS[name].get(kind, 0), (reagent, kind)
+
+    assert policy.seconds('aspirate', 'precip') > policy.seconds('aspirate', 'water')
+    assert policy.swap_seconds(1) == 0
+
+
+# a fixed delay waits after everything but a tip drop, and between the
+# drop and pick-up of a BLOCK 1 tip swap only
+def test_a_fixed_delay_is_the_old_behaviour():
+    policy = DelayPolicy(fixed=0.25)
+
+    assert policy.seconds('aspirate', 'precip') == policy.seconds('move_to') == 0.25
+    assert policy.seconds('drop_tip') == 0
+    assert policy.swap_seconds(1) == 0.25
+    assert policy.swap_seconds(2) == 0
+
+
+# the spec's own 'delays' win over the registry's, no table at all falls back
+# to the fixed settings['delay']
+def test_which_table_a_plan_uses(specs):
+    spec   = specs['OT2_HEWL_PC.py']
+    own    = {'viscous': {'aspirate': 9}}
+
+    assert PlanBuilder(spec).delays.table == {name: c.delays for name, c in LIQUIDS.items()}
+    assert PlanBuilder(dict(spec, delays=own)).delays.seconds('aspirate', 'precip') == 9
+    assert PlanBuilder(dict(spec, liquids=None)).delays.fixed == spec['settings']['delay']
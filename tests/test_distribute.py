@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.engine import PlanBuilder, aliquot_batches, plan_plate, plan_settings
+from crystal_engine.liquids import LIQUIDS
+
+
+def test_batches_fill_the_tip_and_no_more():
+    transfers = [('A1', 60), ('A2', 60), ('A3', 60), ('A4', 1)]
+
+    assert aliquot_batches(transfers, 180) == [[('A1', 60), ('A2', 60), ('A3', 60)], [('A4', 1)]]
+    assert aliquot_batches(transfers, 179.9) == [[('A1', 60), ('A2', 60)], [('A3', 60), ('A4', 1)]]
+    assert aliquot_batches([], 180) == []
+
+
+# a transfer over the tip goes on its own (fill_reservoir splits it), one
+# that just fits still batches
+def test_a_transfer_bigger_than_the_tip_goes_alone():
+    transfers = [('A1', 20), ('A2', 181), ('A3', 180), ('A4', 20)]
+
+    assert aliquot_batches(transfers, 180) == [[('A1', 20)], [('A2', 181)], [('A3', 180)], [('A4', 20)]]
+
+
+# what a tip load holds is the tip less the cushion and the class's air gap
+def test_the_cushion_and_air_gap_come_off_the_tip(specs):
+    spec    = specs['OT2_HEWL_PC.py']
+    gapped  = dict(LIQUIDS, viscous=LIQUIDS['viscous']._replace(air_gap=15))
+    b       = PlanBuilder(dict(spec, liquids=gapped))
+    s       = b.settings
+
+    assert b.tip_capacity('p300', 'buffer46') == s['p300_tip_size'] - s['const_vol_in_p300']
+    assert b.tip_capacity('p300', 'precip') == s['p300_tip_size'] - s['const_vol_in_p300'] - 15
+
+    settings = dict(spec['settings'], const_vol_in_p300=spec['settings']['p300_tip_size'])
+    with pytest.raises(ValueError, match='no room'):
+        PlanBuilder(dict(spec, settings=settings)).tip_capacity('p300', 'buffer46')
+
+
+# no BLOCK 1 draw, cushion included, ever takes more than the tip holds
+def test_distributed_draws_fit_the_tip(specs):
+    for name, spec in specs.items():
+        settings = plan_settings(spec)
+        held     = {}
+
+        for step in plan_plate(dict(spec, distribute=True)):
+            if step.block != 1:
+                continue
+            if step.kind == 'pick_up_tip':
+                held[step.pipette] = 0
+            elif step.kind in ('aspirate', 'air_gap'):
+                held[step.pipette] = held[step.pipette] + step.volume
+                assert held[step.pipette] <= settings[step.pipette + '_tip_size'] + 1e-6, (name, step)
+            elif step.kind == 'dispense':
+                held[step.pipette] = held[step.pipette] - step.volume
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.estimate import simulate, summarize
+from crystal_engine.runner import plan_run
+
+
+# every second of travel lands in 'moving', whatever command made the trip,
+# and the columns still add up to the run
+@pytest.mark.parametrize('name', ['OT2_HEWL_PC.py', 'CJ_single_tip_V5.py', 'mock_crystal_testAll_V5.py'])
+def test_travel_counts_as_moving(specs, name):
+    timed   = simulate(specs[name], plan_run(specs[name]))
+    summary = summarize(timed)
+    travel  = sum(command.travel for _, command in timed)
+    moves   = sum(command.seconds - command.travel for _, command in timed if command.kind == 'move_to')
+    moving  = sum(row['moving'] for row in summary['blocks'].values())
+
+    assert travel > sum(command.seconds for _, command in timed if command.kind == 'move_to')
+    assert moving == pytest.approx(travel + moves)
+    for row in summary['blocks'].values():
+        assert row['moving'] + row['liquid'] + row['tips'] + row['delay'] == pytest.approx(row['total'])
+    assert summary['total'] == pytest.approx(sum(command.seconds for _, command in timed))
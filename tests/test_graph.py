@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from crystal_engine.engine import plan_plate
+from crystal_engine.graph import task_graph, violations
+from crystal_engine.runner import plan_run
+
+
+def test_the_scripts_plans_keep_the_task_graph(specs):
+    for name, spec in specs.items():
+        for mix in (False, 'pass', 'last'):
+            s = dict(spec, mix=mix)
+            assert violations(task_graph(s), s, plan_run(s)) == [], (name, mix)
+
+
+def test_a_reordered_plan_shows_up_as_violations(specs):
+    spec  = specs['OT2_HEWL_PC.py']
+    steps = plan_plate(spec)
+
+    # every drop in front of the reservoirs it sits over
+    drops_first = [s for s in steps if s.block == 4] + [s for s in steps if s.block != 4]
+    broken      = violations(task_graph(spec), spec, drops_first)
+
+    assert broken
+    assert {kind for _, _, kind in broken} == {'drop'}
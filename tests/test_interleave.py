@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from crystal_engine.engine import plan_plate
+from crystal_engine.estimate import simulate
+from crystal_engine.interleave import interleave
+
+
+def test_interleaved_plans_fill_every_well_the_same(spec, same_plate):
+    serial = plan_plate(spec)
+
+    same_plate(spec, interleave(spec, serial), serial)
+
+
+def test_no_drop_goes_in_while_a_tip_holds_liquid(specs):
+    for name, spec in specs.items():
+        steps = interleave(spec, plan_plate(spec))
+        held  = {}
+
+        for step in steps:
+            if step.block == 4 and step.kind == 'pick_up_tip':
+                assert not any(round(uL, 6) for pip, uL in held.items() if pip != step.pipette), name
+            if step.block == 4:
+                continue
+            if step.kind in ('pick_up_tip', 'drop_tip'):
+                held[step.pipette] = 0
+            elif step.kind == 'air_gap' or step.kind == 'aspirate' and step.well is not None:
+                held[step.pipette] = held.get(step.pipette, 0) + step.volume
+            elif step.kind == 'dispense':
+                held[step.pipette] = max(held.get(step.pipette, 0) - step.volume, 0)
+
+
+def test_interleaving_saves_time_on_the_mock_plate(specs):
+    spec   = specs['mock_crystal_testAll_V5.py']
+    serial = plan_plate(spec)
+
+    def seconds(steps):
+        return sum(command.seconds for _, command in simulate(spec, steps))
+
+    assert seconds(interleave(spec, serial)) < seconds(serial) - 10
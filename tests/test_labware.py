@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from crystal_engine import labware
+
+
+# the loader as a fresh run sees it, with the working directory at cwd
+@pytest.fixture
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(labware, '_loaded', None)
+    monkeypatch.setattr(labware, 'SEARCH_DIRS', [labware.DEFINITIONS_DIR, labware.ROOT, str(tmp_path)])
+    return tmp_path
+
+
+def test_other_json_in_the_working_directory_is_not_read(fresh):
+    (fresh / 'notes.json').write_text('{not json')
+    (fresh / 'crystal_engine_checkpoint.json').write_text('{}')
+
+    files = [p.split('/')[-1] for p in labware.labware_files()]
+    assert 'notes.json' not in files and 'crystal_engine_checkpoint.json' not in files
+    assert set(labware.DEFINITION_FILES.values()) <= set(files)
+    assert set(labware.DEFINITION_FILES) <= set(labware.custom_definitions())
+
+
+def test_a_broken_definition_is_logged_and_skipped(fresh, monkeypatch, caplog):
+    monkeypatch.setattr(labware, 'DEFINITION_FILES', dict(labware.DEFINITION_FILES, broken='broken.json'))
+    (fresh / 'broken.json').write_text('{not json')
+
+    definitions = labware.custom_definitions()
+
+    assert 'broken.json' in caplog.text
+    assert set(labware.DEFINITION_FILES) - {'broken'} <= set(definitions)
+
+
+# the shipped Cryschem definition with one thing changed by change(definition)
+def broken(change):
+    definition = json.loads(json.dumps(labware.custom_definitions()['hamptonresearch_24_wellplate_24x500ul_jd']))
+    change(definition)
+    return definition
+
+
+def test_validate_takes_the_shipped_definitions():
+    for definition in labware.custom_definitions().values():
+        assert labware.validate(definition) is definition
+
+
+@pytest.mark.parametrize('change, message', [
+    (lambda d: d['wells']['A1'].update(x=d['dimensions']['xDimension']), 'outside the labware'),
+    (lambda d: d['wells']['D6'].update(y=-1), 'outside the labware'),
+    (lambda d: d['wells']['A1'].update(z=d['dimensions']['zDimension']), 'labware is'),
+    (lambda d: d['wells']['A1'].update(depth=0), 'depth'),
+    (lambda d: d['ordering'][0].pop(), 'ordering and wells'),
+    (lambda d: d.pop('cornerOffsetFromSlot'), 'cornerOffsetFromSlot'),
+])
+def test_validate_rejects_a_broken_definition(change, message):
+    with pytest.raises(labware.LabwareError, match=message):
+        labware.validate(broken(change), 'plate.json')
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from crystal_engine.engine import DEFAULT_DECK, PLATE
+from crystal_engine.layout import neighbours, optimize_layout, touching, valid
+from crystal_engine.runner import plan_run
+from crystal_engine.scheduler import travel_mm
+from crystal_engine.tips import with_tip_racks
+
+
+HAMPTON = DEFAULT_DECK['labware'][PLATE][0]
+
+
+def test_labware_has_to_fit_on_the_deck():
+    labware = dict(DEFAULT_DECK['labware'])
+
+    assert valid(labware)
+    assert not valid(dict(labware, protein=(labware['protein'][0], labware['colors'][1])))
+    assert not valid(dict(labware, crystal_plate=(HAMPTON, 2)))     # covers slot 5, the protein rack
+    assert not valid(dict(labware, crystal_plate=(HAMPTON, 9)))     # covers the trash
+    assert not valid(dict(labware, crystal_plate=(HAMPTON, 10)))    # off the back of the deck
+
+
+def test_a_labware_can_be_kept_beside_another():
+    labware = dict(DEFAULT_DECK['labware'], protein=('opentrons_24_tuberack_nest_1.5ml_snapcap', 11))
+
+    assert touching([1], [2]) and touching([1], [4]) and not touching([1], [5]) and not touching([3], [4])
+    assert valid(labware)
+    assert not valid(labware, {'protein': [PLATE]})
+    assert all(valid(d['labware'], {'protein': [PLATE]}) for d in neighbours(DEFAULT_DECK, {'protein': [PLATE]}))
+
+
+def test_the_best_layout_is_valid_and_travels_less(specs):
+    spec   = specs['OT2_HEWL_PC.py']
+    steps  = plan_run(spec)
+    before = with_tip_racks(DEFAULT_DECK, steps)
+    beside = {'protein': [PLATE]}
+
+    after, mm = optimize_layout(steps, before, beside)
+
+    assert valid(after['labware'], beside)
+    assert mm == travel_mm(steps, after) <= travel_mm(steps, before)
+    assert set(after['labware']) == set(before['labware'])
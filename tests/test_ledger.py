@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.engine import plan_plate
+from crystal_engine.ledger import SourceVolumeError, check_volumes, dead_volume, ledger
+
+
+def with_volume(spec, name, mL):
+    return dict(spec, sources=dict(spec['sources'], **{name: dict(spec['sources'][name], volume=mL)}))
+
+
+# every uL the plan draws is on the ledger, as well or as cushion
+def test_the_ledger_adds_up_every_draw(specs):
+    for name, spec in specs.items():
+        steps   = plan_plate(spec)
+        entries = ledger(spec, steps)
+
+        for reagent, e in entries.items():
+            drawn = sum(s.volume * (s.channels or 1) for s in steps if s.kind == 'aspirate' and s.reagent == reagent)
+            assert e['draw'] == pytest.approx(drawn), (name, reagent)
+            assert e['left'] == pytest.approx(e['start'] - drawn), (name, reagent)
+
+
+def test_a_tube_that_runs_dry_stops_the_run_first(specs):
+    spec = specs['OT2_HEWL_PC.py']
+    e    = ledger(spec)['precip']
+    need = (e['draw'] + e['dead']) / 1000
+
+    check_volumes(with_volume(spec, 'precip', need + 0.01))
+    with pytest.raises(SourceVolumeError, match='precip .* fill it to'):
+        check_volumes(with_volume(spec, 'precip', need - 0.01))
+
+
+# a fill is never more than the tube holds; more than that takes several tubes
+def test_the_recommended_fill_fits_the_tube(specs):
+    spec    = specs['OT2_HEWL_PC.py']
+    entries = ledger(spec)
+
+    for reagent, e in entries.items():
+        assert e['recommended'] * 1000 <= e['capacity'], reagent
+
+    source  = spec['sources']['protein']
+    crowded = dict(spec, sources=dict(spec['sources'], precip=dict(source, volume=1)))
+    e       = ledger(crowded)['precip']
+    assert e['tubes'] > 1
+    assert e['tubes'] * (e['recommended'] * 1000 - e['dead']) >= e['draw']
+    assert dead_volume(source['vial']) == e['dead']
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from crystal_engine.engine import DEFAULT_SETTINGS, PlanBuilder, plan_plate
+from crystal_engine.liquids import LIQUIDS
+
+
+def rates(steps, block):
+    return {s.rate for s in steps if s.kind == 'dispense' and s.block == block}
+
+
+# a rate the spec sets itself wins, then the liquid class, then the default
+def test_rate_precedence(specs):
+    spec     = specs['OT2_HEWL_PC.py']
+    settings = dict(spec['settings'], reservoir_rate=0.3, drop_rate=0.2)
+
+    classes  = PlanBuilder(spec)
+    own      = PlanBuilder(dict(spec, settings=settings))
+    defaults = PlanBuilder(dict(spec, liquids=None))
+
+    assert classes.rate('precip', 'dispense', 'reservoir_rate') == LIQUIDS['viscous'].dispense_rate
+    assert classes.rate('buffer46', 'dispense', 'reservoir_rate') == LIQUIDS['buffer'].dispense_rate
+    assert own.rate('buffer46', 'dispense', 'reservoir_rate') == 0.3
+    assert own.rate('protein', 'dispense', 'drop_rate') == 0.2
+    assert own.rate('buffer46', 'aspirate') == LIQUIDS['buffer'].aspirate_rate
+    assert defaults.rate('buffer46', 'dispense', 'reservoir_rate') == DEFAULT_SETTINGS['reservoir_rate']
+    assert defaults.rate('buffer46', 'aspirate') is None
+
+
+# the mock's own 0.5 reservoir and mix rates reach the plan
+def test_the_mock_keeps_its_own_rates(specs):
+    steps = plan_plate(specs['mock_crystal_testAll_V5.py'])
+
+    assert rates(steps, 1) == {0.5}
+    assert rates(steps, 3) == {0.5}
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+from crystal_engine.engine import PLATE, PlanBuilder, plan_plate, plan_settings
+
+
+def plate_dispenses(steps):
+    return [s for s in steps if s.kind == 'dispense' and s.target.labware == PLATE]
+
+
+# {(well, reagent): uL} that went into the plate
+def well_volumes(steps):
+    totals = Counter()
+    for step in plate_dispenses(steps):
+        totals[step.well, step.reagent] += step.volume * (step.channels or 1)
+    return {key: round(uL, 6) for key, uL in totals.items()}
+
+
+def test_last_mode_dispenses_no_share_under_the_pipette_minimum(specs):
+    for name, spec in specs.items():
+        settings = plan_settings(spec)
+        plain    = plan_plate(dict(spec, mix=False))
+        last     = plan_plate(dict(spec, mix='last'))
+
+        def small(steps):
+            return Counter((s.pipette, s.well, s.reagent, s.volume) for s in plate_dispenses(steps)
+                           if s.volume < settings[s.pipette + '_min_vol'])
+
+        # whatever is under the minimum was already a single dispense without 'last'
+        assert not small(last) - small(plain), name
+        assert well_volumes(last) == well_volumes(plain), name
+
+
+def test_ring_stops_for_the_smallest_last_volumes(specs):
+    for name, spec in specs.items():
+        b = PlanBuilder(dict(spec, mix='last'))
+        s = b.settings
+
+        for pip in ('p10', 'p300'):
+            smallest = min(v for info in spec['well_information'].values() for v in info.values() if v > 0)
+            stops    = b.ring_stops(pip, smallest)
+            assert stops == 1 or smallest / stops >= s[pip + '_min_vol'], (name, pip, smallest)
+
+        assert b.ring_stops('p10', 2 * s['p10_min_vol'] - 0.1) == 1
+        assert b.ring_stops('p10', 2 * s['p10_min_vol']) == 2
+        assert b.ring_stops('p300', 1000) == s['num_laps']
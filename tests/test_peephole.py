@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+
+import pytest
+
+from crystal_engine.engine import plan_plate
+from crystal_engine.interleave import interleave
+from crystal_engine.peephole import compact
+
+
+@pytest.mark.parametrize('mix', [False, 'pass', 'last'])
+def test_compacted_plans_fill_every_well_the_same(spec, same_plate, mix):
+    s     = dict(spec, mix=mix)
+    steps = plan_plate(s)
+    if s.get('interleave'):
+        steps = interleave(s, steps)
+
+    same_plate(s, compact(s, steps), steps)
+
+
+def test_compact_only_drops_moves(specs):
+    for name, spec in specs.items():
+        for mix in (False, 'pass'):
+            s       = dict(spec, mix=mix)
+            steps   = plan_plate(s)
+            packed  = compact(s, steps)
+            dropped = Counter(steps) - Counter(packed)
+
+            assert dropped, (name, mix)
+            assert {step.kind for step in dropped} == {'move_to'}, (name, mix)
+            assert [t for t in steps if t.kind != 'move_to'] == [t for t in packed if t.kind != 'move_to']
+
+            # a move the tip waits at stays
+            kept = Counter(packed)
+            for i, step in enumerate(steps[:-1]):
+                if step.kind == 'move_to' and steps[i + 1].kind == 'delay':
+                    assert kept[step], (name, mix, i)
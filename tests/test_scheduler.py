@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.deck import position
+from crystal_engine.engine import DEFAULT_DECK, PLATE, plan_plate
+from crystal_engine.scheduler import schedule, serpentine, tour, travel_mm, with_orders, without_orders
+
+
+@pytest.mark.parametrize('strategy', ['tour', 'serpentine'])
+def test_scheduled_plans_fill_every_well_the_same(spec, same_plate, strategy):
+    listed    = without_orders(spec)
+    plain     = plan_plate(listed)
+    scheduled = with_orders(listed, PLATE, schedule(listed, strategy))
+    steps     = plan_plate(scheduled)
+
+    same_plate(scheduled, steps, plain, listed)
+    assert travel_mm(steps) <= travel_mm(plain) + 1e-6
+
+
+def test_orders_visit_every_well_once(specs):
+    spec            = specs['OT2_HEWL_PC.py']
+    load_name, slot = DEFAULT_DECK['labware'][PLATE]
+    wells           = spec['wells']
+    xy              = {w: position(load_name, slot, w)[:2] for w in wells}
+
+    assert sorted(tour(wells, xy, (0, 0))) == sorted(wells)
+    assert sorted(serpentine(wells)) == sorted(wells)
+    assert serpentine(wells)[:7] == ['A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'B6']
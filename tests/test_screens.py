@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.screens import Columns, Fill, Gradient, Rows, build_plate, grid_wells
+
+
+def test_grid_wells():
+    assert grid_wells(24)[:7] == ['A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'B1']
+    assert len(grid_wells(96)) == 96 and grid_wells(96)[-1] == 'H12'
+
+
+def test_every_rule_over_the_plate():
+    plate = build_plate({
+        'buffer': Rows({'A': 50, 'CD': 30}),
+        'salt':   Columns({(1, 2): 10}),
+        'water':  Gradient(50, row_step=-5, column_step=-5),
+        'precip': Fill(400),
+    }, grid_wells(24))
+
+    assert plate['A1'] == {'buffer': 50, 'salt': 10, 'water': 50, 'precip': 290}
+    assert plate['B3'] == {'buffer': 0, 'salt': 0, 'water': 35, 'precip': 365}
+    assert plate['D6'] == {'buffer': 30, 'salt': 0, 'water': 10, 'precip': 360}
+    assert all(sum(volumes.values()) == 400 for volumes in plate.values())
+    assert list(plate['A1']) == ['buffer', 'salt', 'water', 'precip']
+
+
+def test_a_screen_that_does_not_add_up_is_refused():
+    wells = grid_wells(24)
+
+    with pytest.raises(ValueError, match='negative in .*D6'):
+        build_plate({'water': Gradient(50, row_step=-10, column_step=-5)}, wells)
+    with pytest.raises(ValueError, match='negative'):
+        build_plate({'buffer': Rows({'A': 300}), 'precip': Fill(200)}, wells)
+    with pytest.raises(ValueError, match='only one reagent'):
+        build_plate({'water': Fill(400), 'precip': Fill(400)}, wells)
+    with pytest.raises(ValueError, match='unknown screen rule'):
+        build_plate({'water': 50}, wells)
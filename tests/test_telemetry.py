@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import os
+
+from crystal_engine.runner import plan_run, run_plate
+from crystal_engine.simulate import FakeProtocolContext
+from crystal_engine.telemetry import read_events, runs
+
+
+def test_a_simulated_run_is_not_logged(specs, tmp_path):
+    spec = dict(specs['OT2_HEWL_PC.py'], telemetry=str(tmp_path / 'run.jsonl'))
+
+    run_plate(FakeProtocolContext(), spec)
+
+    assert not os.path.exists(spec['telemetry'])
+
+
+def test_every_run_is_added_to_the_log(specs, tmp_path):
+    spec  = dict(specs['OT2_HEWL_PC.py'], telemetry=str(tmp_path / 'run.jsonl'))
+    steps = plan_run(spec)
+
+    run_plate(FakeProtocolContext(simulating=False), spec)
+    run_plate(FakeProtocolContext(simulating=False), spec)
+
+    logged = runs(read_events(spec['telemetry']))
+    assert len(logged) == 2
+    assert all([e['index'] for e in events] == list(range(len(steps))) for events in logged.values())
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crystal_engine.vials import CLEARANCE, VIAL_MODELS, vial_depth, vialPipetteOffsets
+
+
+@pytest.mark.parametrize('name', sorted(vialPipetteOffsets))
+def test_the_model_goes_through_the_calibration(name):
+    vial  = vialPipetteOffsets[name]
+    model = VIAL_MODELS[name]
+
+    assert model.surface(vial['volume_offset'] * 1000) == pytest.approx(vial['offset'], abs=0.01)
+    assert model.surface(vial['volume_step'] * 1000) == pytest.approx(vial['offset'] + vial['step'], abs=0.01)
+    assert model.surface(0) == pytest.approx(vial['offset'] - vial['cone_height'])
+
+
+@pytest.mark.parametrize('name', sorted(vialPipetteOffsets))
+def test_the_table_follows_the_closed_form_both_ways(name):
+    model   = VIAL_MODELS[name]
+    volumes = [model.max_uL * i / 97 for i in range(98)]
+    heights = [model.surface(v) for v in volumes]
+
+    assert heights == sorted(heights)
+    for v, h in zip(volumes, heights):
+        assert h == pytest.approx(model._surface(v), abs=0.05)
+        if model._surface(v) - model.apex > 1:
+            assert model.volume_at(h) == pytest.approx(v, abs=model.step_uL)
+
+
+# an empty tube, or a tube in a shallower rack well, still keeps the tip
+# CLEARANCE off the bottom
+@pytest.mark.parametrize('name', sorted(vialPipetteOffsets))
+def test_no_draw_goes_below_bottom_2(name):
+    model = VIAL_MODELS[name]
+
+    assert vial_depth(name, 0) == ('top', round(model.apex + CLEARANCE, 2))
+    assert vial_depth(name, 0, well_depth=20)[1] >= CLEARANCE - 20
+    assert vial_depth(name, model.max_uL)[1] > vial_depth(name, model.max_uL / 2)[1]